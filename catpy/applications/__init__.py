@@ -1,5 +1,3 @@
-from __future__ import absolute_import
-
 from .base import CatmaidClientApplication
 from .export import ExportWidget
 from .nameresolver import NameResolver
@@ -1,5 +1,3 @@
-from __future__ import absolute_import
-
 from abc import ABC
 from functools import wraps
 
@@ -33,6 +31,10 @@ class CatmaidClientApplication(AbstractCatmaidClient, ABC):
     def fetch(self, *args, **kwargs):
         return self._catmaid.fetch(*args, **kwargs)
 
+    @wraps(CatmaidClient.download)
+    def download(self, *args, **kwargs):
+        return self._catmaid.download(*args, **kwargs)
+
     @classmethod
     def from_json(cls, credentials, *args, **kwargs):
         """
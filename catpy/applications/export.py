@@ -1,14 +1,15 @@
 # -*- coding: utf-8 -*-
-from __future__ import absolute_import
-
 from pkg_resources import parse_version
 from warnings import warn
 from copy import deepcopy
+from typing import NamedTuple, List
 
 import networkx as nx
+import numpy as np
 from networkx.readwrite import json_graph
 
 from catpy.applications.base import CatmaidClientApplication
+from catpy.compat import rustworkx
 
 
 NX_VERSION_INFO = parse_version(nx.__version__)._key[1]
@@ -54,6 +55,126 @@ def convert_nodelink_data(jso):
     return out
 
 
+def _treenode_columns(rows):
+    """Split compact-skeleton treenode rows into ID, parent ID (-1 for the root) and location arrays"""
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty((0, 3))
+
+    # all columns are numeric, so parse straight into a float array; the root's null parent becomes NaN.
+    # IDs are exact in float64 (up to 2**53)
+    arr = np.array(rows, dtype=np.float64)
+    parents = arr[:, 1]
+    return (
+        arr[:, 0].astype(np.int64),
+        np.where(np.isnan(parents), -1, parents).astype(np.int64),
+        arr[:, 3:6],
+    )
+
+
+def _connector_columns(rows):
+    """
+    Split compact-skeleton connector rows into connector ID and location arrays, and per-connector arrays of
+    presynaptic and postsynaptic treenode IDs. Connectors are ordered by first appearance; rows whose relation number
+    (NOT the database relation ID) is neither 0 (presynaptic) nor 1 (postsynaptic) are ignored.
+    """
+    empty = np.empty(0, np.int64), np.empty((0, 3)), [], []
+    if not rows:
+        return empty
+
+    arr = np.array(rows, dtype=np.float64)
+    relations = arr[:, 2].astype(np.int64)
+    keep = (relations == 0) | (relations == 1)
+    arr, relations = arr[keep], relations[keep]
+    if not len(arr):
+        return empty
+
+    conn_ids, first_idxs, groups = np.unique(
+        arr[:, 1].astype(np.int64), return_index=True, return_inverse=True
+    )
+    order = np.argsort(first_idxs, kind="stable")
+
+    # stable sort by (connector, relation), then split into one run of treenode IDs per pair
+    keys = groups.ravel() * 2 + relations
+    by_key = np.argsort(keys, kind="stable")
+    bounds = np.searchsorted(keys[by_key], np.arange(1, len(conn_ids) * 2))
+    runs = np.split(arr[by_key, 0].astype(np.int64), bounds)
+
+    return (
+        conn_ids[order],
+        arr[first_idxs[order], 3:6],
+        [runs[2 * idx] for idx in order],
+        [runs[2 * idx + 1] for idx in order],
+    )
+
+
+class SkeletonGeometry(NamedTuple):
+    """
+    Treenode and connector geometry of a skeleton, as parallel arrays.
+
+    Treenodes are in the order returned by CATMAID; the root's parent ID is -1. Connectors are in order of first
+    appearance; presynaptic[i] and postsynaptic[i] hold the IDs of the skeleton's treenodes linked to connector_ids[i]
+    by that relation.
+    """
+
+    treenode_ids: np.ndarray
+    parent_ids: np.ndarray
+    treenode_locations: np.ndarray
+    connector_ids: np.ndarray
+    connector_locations: np.ndarray
+    presynaptic: List[np.ndarray]
+    postsynaptic: List[np.ndarray]
+
+    @classmethod
+    def from_response(cls, response, location_dtype=np.float64):
+        """
+        Parse the response of CATMAID's {project_id}/{skeleton_id}/1/0/compact-skeleton endpoint.
+
+        Locations are stored as contiguous N by 3 arrays of `location_dtype`: np.float32 halves their memory, at the
+        cost of precision beyond ~7 significant figures.
+        """
+        tn_ids, parent_ids, tn_locations = _treenode_columns(response[0])
+        conn_ids, conn_locations, pre, post = _connector_columns(response[1])
+        return cls(
+            tn_ids,
+            parent_ids,
+            # copy out of the parsed rows so they can be freed
+            tn_locations.astype(location_dtype),
+            conn_ids,
+            conn_locations.astype(location_dtype),
+            pre,
+            post,
+        )
+
+    def as_legacy_dict(self):
+        """Convert into the dict-of-dicts representation used by `ExportWidget.get_treenode_and_connector_geometry`"""
+        treenodes = {
+            tn_id: {
+                "location": location,
+                "parent_id": None if parent_id < 0 else parent_id,
+            }
+            for tn_id, parent_id, location in zip(
+                self.treenode_ids.tolist(),
+                self.parent_ids.tolist(),
+                self.treenode_locations.tolist(),
+            )
+        }
+        # nb: "presnaptic_to" is the key this representation has always used
+        connectors = {
+            conn_id: {
+                "presnaptic_to": pre.tolist(),
+                "postsynaptic_to": post.tolist(),
+                "location": location,
+            }
+            for conn_id, location, pre, post in zip(
+                self.connector_ids.tolist(),
+                self.connector_locations.tolist(),
+                self.presynaptic,
+                self.postsynaptic,
+            )
+        }
+        return {"treenodes": treenodes, "connectors": connectors}
+
+
 class ExportWidget(CatmaidClientApplication):
     def get_swc(self, skeleton_id, linearize_ids=False):
         """
@@ -73,6 +194,28 @@ class ExportWidget(CatmaidClientApplication):
             {"linearize_ids": "true" if linearize_ids else "false"},
         )
 
+    def get_swc_to(self, skeleton_id, fileobj, linearize_ids=False):
+        """
+        Write a single skeleton in SWC format to a file as it is downloaded.
+
+        Parameters
+        ----------
+        skeleton_id : int or str
+        fileobj : file-like
+            Binary file-like object
+        linearize_ids : bool
+
+        Returns
+        -------
+        int
+            Number of bytes written
+        """
+        return self.download(
+            (self.project_id, "skeleton", skeleton_id, "swc"),
+            fileobj,
+            data={"linearize_ids": "true" if linearize_ids else "false"},
+        )
+
     def get_connector_archive(self, *args, **kwargs):
         """Not implemented: requires an async job"""
         raise NotImplementedError("Requires an async job")
@@ -122,6 +265,43 @@ class ExportWidget(CatmaidClientApplication):
             data = convert_nodelink_data(data)
         return json_graph.node_link_graph(data, directed=True)
 
+    def get_rustworkx(self, *skeleton_ids):
+        """
+        Get a rustworkx PyDiGraph of the given skeletons: much faster than networkx to build and traverse for large
+        graphs. Requires rustworkx to be installed.
+
+        Node payloads are the node dicts (including "id", the skeleton ID) and edge payloads are the link dicts
+        without "source" and "target"; node indices follow the order of the "nodes" in `get_networkx_dict`.
+
+        Parameters
+        ----------
+        skeleton_ids : array-like of (int or str)
+
+        Returns
+        -------
+        rustworkx.PyDiGraph
+        """
+        if rustworkx is None:
+            raise ImportError("get_rustworkx requires rustworkx to be installed")
+
+        data = self.get_networkx_dict(*skeleton_ids)
+        graph = rustworkx.PyDiGraph(
+            multigraph=data.get("multigraph", True), attrs=data.get("graph")
+        )
+        # links refer to nodes by their indices in "nodes", which become their indices in the graph
+        graph.add_nodes_from(data["nodes"])
+        graph.add_edges_from(
+            [
+                (
+                    link["source"],
+                    link["target"],
+                    {k: v for k, v in link.items() if k not in ("source", "target")},
+                )
+                for link in data["links"]
+            ]
+        )
+        return graph
+
     def get_neuroml(self, skeleton_ids, skeleton_inputs=tuple()):
         """
         Get NeuroML v1.8.1 (level 3, NetworkML) for the given skeletons, possibly with their input synapses
@@ -142,7 +322,40 @@ class ExportWidget(CatmaidClientApplication):
         str
             NeuroML output string
         """
+        return self.post(
+            (self.project_id, "neuroml", "neuroml_level3_v181"),
+            data=self._neuroml_data(skeleton_ids, skeleton_inputs),
+        )
+
+    def get_neuroml_to(self, skeleton_ids, fileobj, skeleton_inputs=tuple()):
+        """
+        Write NeuroML v1.8.1 (level 3, NetworkML) for the given skeletons to a file as it is downloaded.
+
+        See `get_neuroml` for details.
+
+        Parameters
+        ----------
+        skeleton_ids : array-like
+            Skeletons whose NeuroML to return
+        fileobj : file-like
+            Binary file-like object
+        skeleton_inputs : array-like, optional
+            If specified, only input synapses from these skeletons will be added to the NeuroML
+
+        Returns
+        -------
+        int
+            Number of bytes written
+        """
+        return self.download(
+            (self.project_id, "neuroml", "neuroml_level3_v181"),
+            fileobj,
+            method="POST",
+            data=self._neuroml_data(skeleton_ids, skeleton_inputs),
+        )
 
+    @staticmethod
+    def _neuroml_data(skeleton_ids, skeleton_inputs):
         data = {"skids": list(skeleton_ids)}
 
         if skeleton_inputs:
@@ -153,7 +366,34 @@ class ExportWidget(CatmaidClientApplication):
             else:
                 data["inputs"] = list(skeleton_inputs)
 
-        return self.post((self.project_id, "neuroml", "neuroml_level3_v181"), data=data)
+        return data
+
+    def get_skeleton_geometry(self, *skeleton_ids, location_dtype=np.float64):
+        """
+        Get the treenode and connector geometry of the given skeletons as arrays, which is much more compact than
+        `get_treenode_and_connector_geometry`'s representation for large skeletons.
+
+        Parameters
+        ----------
+        skeleton_ids : array-like of (int or str)
+        location_dtype : np.dtype, optional
+            dtype of the location arrays: np.float32 halves their size (default np.float64)
+
+        Returns
+        -------
+        dict of int to SkeletonGeometry
+        """
+        # requests for all skeletons are in flight at once
+        responses = self.fetch_many(
+            [
+                ((self.project_id, skeleton_id, 1, 0, "compact-skeleton"), "GET")
+                for skeleton_id in skeleton_ids
+            ]
+        )
+        return {
+            int(skeleton_id): SkeletonGeometry.from_response(response, location_dtype)
+            for skeleton_id, response in zip(skeleton_ids, responses)
+        }
 
     def get_treenode_and_connector_geometry(self, *skeleton_ids):
         """
@@ -194,42 +434,8 @@ class ExportWidget(CatmaidClientApplication):
         skeletons = dict()
         warnings = set()
 
-        relation_names = {0: "presnaptic_to", 1: "postsynaptic_to"}
-
-        for skeleton_id in skeleton_ids:
-
-            data = self.get(
-                "{}/{}/1/0/compact-skeleton".format(self.project_id, skeleton_id)
-            )
-
-            skeleton = {"treenodes": dict(), "connectors": dict()}
-
-            for treenode in data[0]:
-                skeleton["treenodes"][int(treenode[0])] = {
-                    "location": treenode[3:6],
-                    "parent_id": None if treenode[1] is None else int(treenode[1]),
-                }
-
-            for connector in data[1]:
-                # NOT the database relation ID
-                # {pre: 0, post: 1, gj: 2}
-                relation_number = connector[2]
-
-                if relation_number not in relation_names:
-                    continue
-
-                conn_id = int(connector[1])
-                if conn_id not in skeleton["connectors"]:
-                    skeleton["connectors"][conn_id] = {
-                        rn: [] for rn in relation_names.values()
-                    }
-
-                skeleton["connectors"][conn_id]["location"] = connector[3:6]
-                skeleton["connectors"][conn_id][relation_names[relation_number]].append(
-                    connector[0]
-                )
-
-            skeletons[int(skeleton_id)] = skeleton
+        for skeleton_id, geometry in self.get_skeleton_geometry(*skeleton_ids).items():
+            skeletons[skeleton_id] = geometry.as_legacy_dict()
 
         warn(
             "Skeleton representations contained some unknown treenode->connector relation IDs:\n\t"
@@ -1,4 +1,3 @@
-from __future__ import unicode_literals, absolute_import
 import logging
 from functools import lru_cache
 
@@ -1,14 +1,42 @@
 # -*- coding: utf-8 -*-
 
-from __future__ import division, unicode_literals, absolute_import
-
-import json
 from abc import abstractmethod, ABC
+from collections import OrderedDict
+from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from weakref import WeakKeyDictionary
+from urllib.parse import urlencode
 
 import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.retry import Retry
 
+from catpy.compat import ijson, json_loads
 from catpy.exceptions import WrappedCatmaidException
 
+# shared default for requests with no params/payload; requests never mutates it
+_EMPTY = dict()
+
+# number of keep-alive connections kept open to the server
+DEFAULT_POOL_SIZE = 32
+
+# requests failing with a gateway error, or failing to connect or read, are retried a few times
+DEFAULT_RETRY = Retry(
+    total=3,
+    backoff_factor=0.2,
+    status_forcelist=(502, 503, 504),
+    raise_on_status=False,
+)
+
+# number of parsed GET responses kept for ETag revalidation
+DEFAULT_ETAG_CACHE_SIZE = 256
+
+# client -> {(project_id, stack_id): stack info}; stack metadata is static, so is fetched once per client
+_stack_info_cache = WeakKeyDictionary()
+_stack_info_lock = Lock()
+
 
 class AbstractCatmaidClient(ABC):
     """
@@ -17,6 +45,8 @@ class AbstractCatmaidClient(ABC):
     Users should not subclass this; it is provided purely as a convenience for type checking.
     """
 
+    __slots__ = ()
+
     def get(self, relative_url, params=None, raw=False, **kwargs):
         """
         Get data from a running instance of CATMAID.
@@ -65,6 +95,37 @@ class AbstractCatmaidClient(ABC):
         """
         return self.fetch(relative_url, method="POST", data=data, raw=raw, **kwargs)
 
+    def fetch_many(self, specs, max_workers=16):
+        """
+        Send several requests to a running instance of CATMAID concurrently.
+
+        The underlying session is shared between threads; this is safe for independent GET/POST requests.
+
+        Parameters
+        ----------
+        specs : iterable of tuple
+            Positional arguments for `fetch` for each request, i.e. (relative_url[, method[, data[, raw]]])
+        max_workers : int, optional
+            Maximum number of requests in flight at once (default 16)
+
+        Returns
+        -------
+        list
+            Data returned from CATMAID for each request, in the same order as `specs`. If any request fails, the
+            exception of the first failed one (in input order) is raised.
+        """
+        with ThreadPoolExecutor(max_workers) as executor:
+            futures = [executor.submit(self.fetch, *spec) for spec in specs]
+            return [future.result() for future in futures]
+
+    def invalidate_stack_cache(self):
+        """
+        Forget any stack info cached for this client, e.g. by `CoordinateTransformer.from_catmaid`, so that it is
+        fetched from the server again the next time it is needed.
+        """
+        with _stack_info_lock:
+            _stack_info_cache.pop(self, None)
+
     @abstractmethod
     def fetch(self, relative_url, method="GET", data=None, raw=False, **kwargs):
         pass
@@ -79,8 +140,29 @@ class CatmaidClient(AbstractCatmaidClient):
     different interfaces.
     """
 
+    __slots__ = (
+        "base_url",
+        "project_id",
+        "_session",
+        "_pool",
+        "_etag_cache",
+        "_etag_cache_size",
+        "_etag_lock",
+        "_dispatch",
+        "_pool_size",
+        "__weakref__",
+    )
+
     def __init__(
-        self, base_url, token=None, auth_name=None, auth_pass=None, project_id=None
+        self,
+        base_url,
+        token=None,
+        auth_name=None,
+        auth_pass=None,
+        project_id=None,
+        etag_cache=False,
+        pool_size=DEFAULT_POOL_SIZE,
+        etag_cache_size=DEFAULT_ETAG_CACHE_SIZE,
     ):
         """
         Instantiate CatmaidClient object for handling requests to a CATMAID server.
@@ -97,10 +179,24 @@ class CatmaidClient(AbstractCatmaidClient):
             HTTP auth password
         project_id : int
             (Optional)
+        etag_cache : bool
+            Whether to keep the parsed responses to GET requests which carry an ETag, and revalidate them with the
+            server (If-None-Match) rather than downloading and parsing them again. Useful for repeatedly requesting
+            static data such as stack info. Revalidated results are shared with the cache, so should not be mutated.
+            Default False
+        pool_size : int
+            Maximum number of keep-alive connections to the server, which should be at least the number of threads
+            sharing this client. Idempotent requests failing with HTTP502-504 are retried a few times.
+            Default 32
+        etag_cache_size : int
+            Maximum number of responses kept for ETag revalidation, least recently used first to be dropped.
+            Default 256
         """
         self.base_url = base_url
 
-        self._session = requests.Session()
+        self._session = pooled_session(pool_size)
+        self._pool_size = pool_size
+        self._pool = None
         if auth_name is not None and auth_pass is not None:
             self.set_http_auth(auth_name, auth_pass)
         if token is not None:
@@ -108,6 +204,36 @@ class CatmaidClient(AbstractCatmaidClient):
 
         self.project_id = project_id
 
+        # (url, encoded params, raw) -> (ETag, parsed response), in least- to most-recently used order
+        self._etag_cache = OrderedDict() if etag_cache else None
+        self._etag_cache_size = etag_cache_size
+        self._etag_lock = Lock()
+
+        # HTTP method -> (session method, keyword under which the data is passed)
+        self._dispatch = {
+            "GET": (self._session.get, "params"),
+            "POST": (self._session.post, "data"),
+        }
+        self._dispatch.update(
+            {method.lower(): value for method, value in self._dispatch.items()}
+        )
+
+    def __getstate__(self):
+        # locks and connection pools cannot be pickled, so are recreated on load
+        state = dict(getattr(self, "__dict__", _EMPTY))
+        for name in CatmaidClient.__slots__:
+            if name not in ("__weakref__", "_etag_lock", "_pool") and hasattr(
+                self, name
+            ):
+                state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._etag_lock = Lock()
+        self._pool = None
+
     def set_http_auth(self, username, password):
         """
         Set HTTP authorization for CatmaidClient in place.
@@ -125,6 +251,7 @@ class CatmaidClient(AbstractCatmaidClient):
             Reference to the same, now-authenticated CatmaidClient instance
         """
         self._session.auth = (username, password)
+        self._pool = None
         return self
 
     def set_api_token(self, token):
@@ -142,6 +269,7 @@ class CatmaidClient(AbstractCatmaidClient):
             Reference to the same, now-authenticated CatmaidClient instance
         """
         self._session.headers["X-Authorization"] = "Token " + token
+        self._pool = None
         return self
 
     def _make_request_url(self, arg):
@@ -162,6 +290,138 @@ class CatmaidClient(AbstractCatmaidClient):
         else:
             return make_url(self.base_url, *arg)
 
+    def _get_revalidated(self, send, url, raw=False, **kwargs):
+        """
+        GET the given URL, sending the ETag of any previously cached response for it, and parse the response.
+
+        If the server responds with HTTP304 (Not Modified), the cached parsed response is returned instead.
+
+        Parameters
+        ----------
+        send : callable
+            Session method to send the request with
+        url : str
+            Absolute URL
+        raw : bool
+            Whether to return the response as a string regardless of its content-type
+        kwargs
+            Passed to `send`; must include `params`
+
+        Returns
+        -------
+        dict or list or str
+        """
+        params = kwargs["params"]
+        if not isinstance(params, (str, bytes)):
+            params = urlencode(params, doseq=True)
+        key = (url, params, raw)
+
+        with self._etag_lock:
+            cached = self._etag_cache.get(key)
+        if cached is not None:
+            headers = dict(kwargs.get("headers") or ())
+            headers["If-None-Match"] = cached[0]
+            kwargs["headers"] = headers
+
+        response = send(url, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            with self._etag_lock:
+                if key in self._etag_cache:
+                    self._etag_cache.move_to_end(key)
+            return cached[1]
+
+        WrappedCatmaidException.raise_for_status(response)
+        parsed = self._parse(response, raw)
+        etag = response.headers.get("ETag")
+        if response.status_code == 200 and etag is not None:
+            with self._etag_lock:
+                self._etag_cache[key] = (etag, parsed)
+                self._etag_cache.move_to_end(key)
+                while len(self._etag_cache) > self._etag_cache_size:
+                    self._etag_cache.popitem(last=False)
+        return parsed
+
+    def _make_pool(self):
+        """
+        Create a urllib3 connection pool which sends the same headers and HTTP auth as the session.
+
+        Returns
+        -------
+        urllib3.PoolManager
+        """
+        headers = dict(self._session.headers)
+        if self._session.auth is not None:
+            headers.update(
+                urllib3.make_headers(basic_auth="{}:{}".format(*self._session.auth))
+            )
+        return urllib3.PoolManager(
+            num_pools=4, maxsize=self._pool_size, headers=headers
+        )
+
+    def fetch_fast(self, relative_url, method="GET", data=None, raw=False):
+        """
+        Lightweight alternative to `fetch` which sends the request with urllib3 directly, skipping requests' request
+        preparation (hooks, cookie merging etc.). Useful for many small requests in a tight loop.
+
+        Connections are pooled separately from `fetch`'s; the session's headers (including the API token) and HTTP
+        auth are shared. HTTP errors are raised as plain `requests.HTTPError`, without CATMAID's error details.
+
+        Parameters
+        ----------
+        relative_url : str or tuple of str
+            URL to send the request to, relative to the base_url. If a tuple is passed, its elements will be joined
+            with '/'.
+        method: {'GET', 'POST'}, optional
+            HTTP method to use (the default is 'GET')
+        data: dict or str, optional
+            JSON-like key/value data to be included in the request as a payload (defaults to empty)
+        raw: bool, optional
+            Whether to return the response as a string regardless of its content-type (by default, JSON responses will
+            be parsed)
+
+        Returns
+        -------
+        dict or list or str
+            Data returned from CATMAID. JSON responses will be parsed unless `raw` is `True`; all other responses
+            will be returned as strings.
+        """
+        url = self._make_request_url(relative_url)
+        method = method.upper()
+        if method not in ("GET", "POST"):
+            raise ValueError("Unknown HTTP method {}".format(repr(method)))
+
+        if self._pool is None:
+            self._pool = self._make_pool()
+        headers = self._pool.headers
+        body = None
+        if data:
+            if not isinstance(data, (str, bytes)):
+                data = urlencode(data, doseq=True)
+            if method == "GET":
+                url += "?" + data
+            else:
+                body = data
+                headers = dict(headers)
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        response = self._pool.urlopen(method, url, body=body, headers=headers)
+        if response.status >= 400:
+            raise requests.HTTPError(
+                "Received HTTP{} from {}".format(response.status, url)
+            )
+        if not raw and response.headers.get("content-type", "").startswith(
+            "application/json"
+        ):
+            return json_loads(response.data)
+        else:
+            return response.data.decode("utf-8")
+
+    def clear_etag_cache(self):
+        """Forget all responses kept for ETag revalidation."""
+        if self._etag_cache is not None:
+            with self._etag_lock:
+                self._etag_cache.clear()
+
     @classmethod
     def from_json(cls, credentials):
         """
@@ -186,8 +446,8 @@ class CatmaidClient(AbstractCatmaidClient):
             Instance of the API, authenticated with the encoded credentials
         """
         if not isinstance(credentials, dict):
-            with open(str(credentials)) as f:
-                credentials = json.load(f)
+            with open(str(credentials), "rb") as f:
+                credentials = json_loads(f.read())
 
         return cls(
             credentials["base_url"],
@@ -222,22 +482,244 @@ class CatmaidClient(AbstractCatmaidClient):
             Data returned from CATMAID. JSON responses will be parsed unless `raw` is `True`; all other responses
             will be returned as strings.
         """
+        return self._fetch(relative_url, method, data, raw, **kwargs)
+
+    def fetch_pipelined(
+        self, relative_urls, method="GET", data=None, raw=False, max_workers=4, **kwargs
+    ):
+        """
+        Fetch several URLs with the same method and data, yielding the results in order.
+
+        Requests are sent and their responses parsed in a pool of threads, so that parsing one response overlaps
+        with downloading the next.
+
+        Parameters
+        ----------
+        relative_urls : iterable of (str or tuple of str)
+            URLs to send the requests to, relative to the base_url (see `fetch`)
+        method: {'GET', 'POST'}, optional
+            HTTP method to use (the default is 'GET')
+        data: dict or str, optional
+            JSON-like key/value data to be included in every request as a payload (defaults to empty)
+        raw: bool, optional
+            Whether to return the responses as strings regardless of their content-type (by default, JSON responses
+            will be parsed)
+        max_workers : int, optional
+            Maximum number of requests in flight at once (default 4)
+        kwargs
+            Extra keyword arguments to pass to `requests.Session.get/post()`, depending on `method`
+
+        Yields
+        ------
+        dict or list or str
+            Data returned from CATMAID, as for `fetch`
+        """
+        with ThreadPoolExecutor(max_workers) as executor:
+            yield from executor.map(
+                lambda relative_url: self._fetch(
+                    relative_url, method, data, raw, **kwargs
+                ),
+                relative_urls,
+            )
+
+    def fetch_stream(
+        self, relative_url, method="GET", data=None, prefix="item", **kwargs
+    ):
+        """
+        Fetch a JSON response, yielding the objects found at `prefix` as they are parsed.
+
+        Useful for endpoints returning very large arrays: if ijson is installed, the body is parsed incrementally as
+        it is downloaded, so neither the whole body nor the whole parsed document is held in memory at once.
+        Otherwise, the response is parsed as for `fetch` and the objects are yielded from the result. The request is
+        not sent until iteration starts.
+
+        Parameters
+        ----------
+        relative_url : str or tuple of str
+            URL to send the request to, relative to the base_url (see `fetch`)
+        method: {'GET', 'POST'}, optional
+            HTTP method to use (the default is 'GET')
+        data: dict or str, optional
+            JSON-like key/value data to be included in the request as a payload (defaults to empty)
+        prefix : str, optional
+            ijson-style path to the objects to yield: dot-separated object keys, with 'item' standing for every
+            element of an array. The default, 'item', yields the elements of a top-level array; '' yields the whole
+            document.
+        kwargs
+            Extra keyword arguments to pass to `requests.Session.get/post()`, depending on `method`
+
+        Yields
+        ------
+        object
+            JSON-like objects found at `prefix`
+        """
+        response = self._send(relative_url, method, data, stream=True, **kwargs)
+        try:
+            if ijson is None:
+                yield from _iter_prefix(json_loads(response.content), prefix)
+            else:
+                response.raw.decode_content = True
+                # as for json, non-integers are floats rather than ijson's default Decimals
+                yield from ijson.items(response.raw, prefix, use_float=True)
+        finally:
+            response.close()
+
+    def download(
+        self,
+        relative_url,
+        fileobj,
+        method="GET",
+        data=None,
+        chunk_size=1 << 16,
+        **kwargs
+    ):
+        """
+        Write the body of a response to a file as it is downloaded, rather than holding it all in memory.
+
+        Parameters
+        ----------
+        relative_url : str or tuple of str
+            URL to send the request to, relative to the base_url (see `fetch`)
+        fileobj : file-like
+            Binary file-like object to write the (undecoded) body to
+        method: {'GET', 'POST'}, optional
+            HTTP method to use (the default is 'GET')
+        data: dict or str, optional
+            JSON-like key/value data to be included in the request as a payload (defaults to empty)
+        chunk_size : int, optional
+            Number of bytes to read from the connection at a time (default 64KiB)
+        kwargs
+            Extra keyword arguments to pass to `requests.Session.get/post()`, depending on `method`
+
+        Returns
+        -------
+        int
+            Number of bytes written
+        """
+        response = self._send(relative_url, method, data, stream=True, **kwargs)
+        written = 0
+        try:
+            for chunk in response.iter_content(chunk_size):
+                written += fileobj.write(chunk) or len(chunk)
+        finally:
+            response.close()
+        return written
+
+    def _fetch(self, relative_url, method="GET", data=None, raw=False, **kwargs):
+        """
+        Send a request to the CATMAID server and parse the response, raising an exception if it fails.
+
+        GET requests go through the ETag cache, if enabled. See `fetch` for parameters.
+
+        Returns
+        -------
+        dict or list or str
+        """
+        send, data_kwarg = self._get_sender(method)
         url = self._make_request_url(relative_url)
-        data = data or dict()
-        if method.upper() == "GET":
-            response = self._session.get(url, params=data, **kwargs)
-        elif method.upper() == "POST":
-            response = self._session.post(url, data=data, **kwargs)
-        else:
-            raise ValueError("Unknown HTTP method {}".format(repr(method)))
+        kwargs[data_kwarg] = data or _EMPTY
+        if self._etag_cache is not None and data_kwarg == "params":
+            return self._get_revalidated(send, url, raw, **kwargs)
 
+        response = send(url, **kwargs)
         WrappedCatmaidException.raise_for_status(response)
-        if response.headers["content-type"] == "application/json" and not raw:
-            return response.json()
+        return self._parse(response, raw)
+
+    def _send(self, relative_url, method="GET", data=None, **kwargs):
+        """
+        Send a request to the CATMAID server, raising an exception if it fails.
+
+        The response is not cached, so that its body can be streamed. See `fetch` for parameters.
+
+        Returns
+        -------
+        requests.Response
+        """
+        send, data_kwarg = self._get_sender(method)
+        url = self._make_request_url(relative_url)
+        kwargs[data_kwarg] = data or _EMPTY
+        response = send(url, **kwargs)
+
+        WrappedCatmaidException.raise_for_status(response)
+        return response
+
+    def _get_sender(self, method):
+        """
+        Get the session method to send a request with, and the keyword under which its data is passed.
+
+        Parameters
+        ----------
+        method : {'GET', 'POST'}
+            HTTP method, case-insensitive
+
+        Returns
+        -------
+        tuple of (callable, str)
+        """
+        try:
+            return self._dispatch[method]
+        except KeyError:
+            try:
+                return self._dispatch[method.upper()]
+            except (KeyError, AttributeError):
+                raise ValueError("Unknown HTTP method {}".format(repr(method)))
+
+    @staticmethod
+    def _parse(response, raw=False):
+        """
+        Extract the data from a successful response.
+
+        Parameters
+        ----------
+        response : requests.Response
+        raw : bool
+            Whether to return the response as a string regardless of its content-type
+
+        Returns
+        -------
+        dict or list or str
+        """
+        # the success path reads the content-type only here; raise_for_status only reads it for errors
+        if not raw and response.headers.get("content-type", "").startswith(
+            "application/json"
+        ):
+            # parse the undecoded body: skips requests' encoding detection and str copy
+            return json_loads(response.content)
         else:
             return response.text
 
 
+def pooled_session(
+    pool_size=DEFAULT_POOL_SIZE, session=None, max_retries=DEFAULT_RETRY
+):
+    """
+    Mount a keep-alive connection pool, which retries on gateway errors, onto a requests session.
+
+    Parameters
+    ----------
+    pool_size : int
+        Number of connections kept open per host (default 32)
+    session : requests.Session, optional
+        Session to mount the pool onto (default a new session)
+    max_retries : urllib3.util.retry.Retry or int, optional
+        Retry policy of the pool (default DEFAULT_RETRY)
+
+    Returns
+    -------
+    requests.Session
+    """
+    if session is None:
+        session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=max_retries,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def make_url(base_url, *args):
     """
     Given any number of URL components, join them as if they were a path regardless of trailing and prepending slashes
@@ -251,10 +733,63 @@ def make_url(base_url, *args):
     >>> make_url('google.com/', '/mail')
     'google.com/mail'
     """
+    if not args:
+        return base_url
+
+    parts = [base_url.rstrip("/")]
     for arg in args:
-        arg_str = str(arg)
-        joiner = "" if base_url.endswith("/") else "/"
-        relative = arg_str[1:] if arg_str.startswith("/") else arg_str
-        base_url = requests.compat.urljoin(base_url + joiner, relative)
+        part = (arg if isinstance(arg, str) else str(arg)).strip("/")
+        if part:
+            parts.append(part)
+
+    # a trailing slash on the last component is significant to the server
+    last = args[-1]
+    if isinstance(last, str) and (not last or last.endswith("/")):
+        parts.append("")
+
+    return "/".join(parts)
+
 
-    return base_url
+def get_stack_info(catmaid_client, stack_id):
+    """
+    Get the info for the given stack in the client's project, caching it for subsequent calls with the same client.
+
+    Use the client's `invalidate_stack_cache` method to clear the cache.
+
+    Parameters
+    ----------
+    catmaid_client : AbstractCatmaidClient
+    stack_id : int
+
+    Returns
+    -------
+    dict
+        Response of CATMAID's {project_id}/stack/{stack_id}/info endpoint.
+        A copy of the cached response, so callers are free to mutate it (or keep references to its members).
+    """
+    key = (catmaid_client.project_id, stack_id)
+    with _stack_info_lock:
+        stack_info = _stack_info_cache.get(catmaid_client, _EMPTY).get(key)
+    if stack_info is None:
+        stack_info = catmaid_client.get(
+            (catmaid_client.project_id, "stack", stack_id, "info")
+        )
+        with _stack_info_lock:
+            _stack_info_cache.setdefault(catmaid_client, dict())[key] = stack_info
+    return deepcopy(stack_info)
+
+
+def _iter_prefix(obj, prefix):
+    """
+    Yield the items of an already-parsed JSON document at an ijson-style prefix (see `CatmaidClient.fetch_stream`).
+    """
+    if not prefix:
+        yield obj
+        return
+
+    key, _, rest = prefix.partition(".")
+    if key == "item":
+        for item in obj:
+            yield from _iter_prefix(item, rest)
+    else:
+        yield from _iter_prefix(obj[key], rest)
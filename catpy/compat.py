@@ -4,12 +4,42 @@ try:
     from tqdm import tqdm
 except ImportError:
 
-    class tqdm(object):
-        def __init__(self, iterable, *args, **kwargs):
-            self.iterable = iterable
+    def tqdm(iterable, *args, **kwargs):
+        """Stand-in for tqdm.tqdm which shows no progress, and adds no overhead to iteration"""
+        return iter(iterable)
 
-        def __iter__(self):
-            return iter(self.iterable)
+    def _write(s, file=None, end="\n", nolock=False):
+        (file or sys.stdout).write(s + end)
 
-        def write(self, s):
-            sys.stdout.write(s)
+    tqdm.write = _write
+
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads  # noqa: F401
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import rustworkx
+except ImportError:
+    rustworkx = None
+
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+try:
+    import blosc2
+except ImportError:
+    blosc2 = None
@@ -13,17 +13,7 @@ class ConnectorRelationType(Enum):
 
     @classmethod
     def from_relation(cls, relation):
-        return {
-            ConnectorRelation.presynaptic_to: cls.SYNAPTIC,
-            ConnectorRelation.postsynaptic_to: cls.SYNAPTIC,
-            ConnectorRelation.gapjunction_with: cls.GAP_JUNCTION,
-            ConnectorRelation.tightjunction_with: cls.TIGHT_JUNCTION,
-            ConnectorRelation.desmosome_with: cls.DESMOSOME,
-            ConnectorRelation.abutting: cls.ABUTTING,
-            ConnectorRelation.attached_to: cls.ATTACHMENT,
-            ConnectorRelation.close_to: cls.SPATIAL,
-            ConnectorRelation.other: cls.OTHER,
-        }[relation]
+        return _REL_TO_TYPE[relation]
 
 
 class ConnectorRelation(Enum):
@@ -49,11 +39,31 @@ class ConnectorRelation(Enum):
 
     @property
     def type(self):
-        return ConnectorRelationType.from_relation(self)
+        return self._type
 
     @property
     def is_synaptic(self):
-        return self.type == ConnectorRelationType.SYNAPTIC
+        return self._is_synaptic
 
     def __str__(self):
-        return self.value
+        # the plain attribute behind the ``value`` descriptor
+        return self._value_
+
+
+_REL_TO_TYPE = {
+    ConnectorRelation.presynaptic_to: ConnectorRelationType.SYNAPTIC,
+    ConnectorRelation.postsynaptic_to: ConnectorRelationType.SYNAPTIC,
+    ConnectorRelation.gapjunction_with: ConnectorRelationType.GAP_JUNCTION,
+    ConnectorRelation.tightjunction_with: ConnectorRelationType.TIGHT_JUNCTION,
+    ConnectorRelation.desmosome_with: ConnectorRelationType.DESMOSOME,
+    ConnectorRelation.abutting: ConnectorRelationType.ABUTTING,
+    ConnectorRelation.attached_to: ConnectorRelationType.ATTACHMENT,
+    ConnectorRelation.close_to: ConnectorRelationType.SPATIAL,
+    ConnectorRelation.other: ConnectorRelationType.OTHER,
+}
+
+# enum members are singletons, so their derived properties can be stored on them
+for _relation, _relation_type in _REL_TO_TYPE.items():
+    _relation._type = _relation_type
+    _relation._is_synaptic = _relation_type is ConnectorRelationType.SYNAPTIC
+del _relation, _relation_type
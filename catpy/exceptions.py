@@ -3,6 +3,8 @@ import textwrap
 
 import requests
 
+from catpy.compat import json_loads
+
 
 class NameResolverException(ValueError):
     pass
@@ -37,7 +39,7 @@ class WrappedCatmaidException(requests.HTTPError):
             response=response,
         )
         if error_data is None:
-            error_data = response.json()
+            error_data = json_loads(response.content)
 
         self.error = error_data["error"]
         self.detail = error_data["detail"]
@@ -59,13 +61,18 @@ class WrappedCatmaidException(requests.HTTPError):
 
     @classmethod
     def raise_for_status(cls, response):
+        if response.status_code < 400:
+            return
         try:
             response.raise_for_status()
         except requests.HTTPError as e:
-            if response.headers.get("content-type") == "application/json":
+            # CATMAID may append a charset, e.g. "application/json; charset=utf-8"
+            if response.headers.get("content-type", "").startswith("application/json"):
+                # parse the body once here and hand it to the constructor
                 try:
-                    wrapped = cls(response)
-                    raise wrapped from e
-                except KeyError:
+                    wrapped = cls(response, json_loads(response.content))
+                except (KeyError, ValueError):
                     pass
+                else:
+                    raise wrapped from e
             raise e
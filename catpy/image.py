@@ -1,26 +1,25 @@
 # -*- coding: utf-8 -*-
 
-from __future__ import division, unicode_literals, absolute_import
-
 import logging
+from functools import partial
 from io import BytesIO
-from collections import OrderedDict
+from collections import OrderedDict, deque
 
 from requests import HTTPError
 import itertools
 from warnings import warn
 
-from concurrent.futures import Future, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
 from PIL import Image
 import numpy as np
-import requests
 from requests_futures.sessions import FuturesSession
 
+from catpy.client import get_stack_info, pooled_session, DEFAULT_RETRY
 from catpy.spatial import StackOrientation, CoordinateTransformer
 from catpy.stacks import StackMirror, ProjectStack, TileIndex
 from catpy.util import StrEnum
-from catpy.compat import tqdm
+from catpy.compat import blosc2, cv2, simplejpeg, tqdm
 
 logger = logging.getLogger()
 
@@ -28,6 +27,9 @@ logger = logging.getLogger()
 DEFAULT_CACHE_ITEMS = 10
 DEFAULT_CACHE_BYTES = None
 THREADS = 10
+# tiles are only retried on gateway errors: retrying connect/read errors would hold a worker for several timeouts
+# per dead tile, rather than failing fast
+TILE_RETRY = DEFAULT_RETRY.new(connect=0, read=0, other=0)
 
 SUPPORTED_CONTENT_TYPES = {"image/png", "image/jpeg"}
 
@@ -65,18 +67,52 @@ DEFAULT_ROI_MODE = ROIMode.STACK
 
 
 def response_to_array(response, pil_kwargs=None):
+    """
+    Decode a greyscale PNG or JPEG response into a (writable) 2D array.
+
+    Parameters
+    ----------
+    response : requests.Response
+    pil_kwargs : dict, optional
+        Passed to PIL's ``Image.convert``; if given, the image is always decoded with PIL
+
+    Returns
+    -------
+    np.ndarray
+    """
+    arr = _response_to_array(response, pil_kwargs)
+    return arr if arr.flags.writeable else arr.copy()
+
+
+def _response_to_array(response, pil_kwargs=None):
+    """As ``response_to_array``, but the array may be a read-only view of the decoder's buffer"""
     response.raise_for_status()
     content_type = response.headers["Content-Type"]
 
-    if content_type in SUPPORTED_CONTENT_TYPES:
+    if content_type == "image/jpeg" and simplejpeg is not None and not pil_kwargs:
+        # libjpeg-turbo decodes straight to greyscale, with no intermediate PIL image
+        return simplejpeg.decode_jpeg(response.content, colorspace="GRAY")[..., 0]
+    elif content_type in SUPPORTED_CONTENT_TYPES and cv2 is not None and not pil_kwargs:
+        # decodes from the response's bytes straight into an array, with no intermediate PIL image
+        arr = cv2.imdecode(
+            np.frombuffer(response.content, dtype=np.uint8), cv2.IMREAD_GRAYSCALE
+        )
+        if arr is None:
+            raise ValueError("Could not decode {} tile".format(content_type))
+        return arr
+    elif content_type in SUPPORTED_CONTENT_TYPES:
         buffer = BytesIO(
             response.content
         )  # opening directly from raw response doesn't work for JPEGs
         raw_img = Image.open(buffer)
         pil_kwargs = dict(pil_kwargs) if pil_kwargs else dict()
         pil_kwargs["mode"] = pil_kwargs.get("mode", "L")
+        if content_type == "image/jpeg" and pil_kwargs == {"mode": "L"}:
+            # have libjpeg decode straight to greyscale, rather than to RGB and then converting
+            raw_img.draft("L", raw_img.size)
         grey_img = raw_img.convert(**pil_kwargs)
-        return np.array(grey_img)
+        # a read-only view of the image's bytes: tiles are only ever read (sliced into the output or cache)
+        return np.asarray(grey_img)
     else:
         raise NotImplementedError(
             "Image fetching is only implemented for greyscale PNG and JPEG, not {}".format(
@@ -85,6 +121,7 @@ def response_to_array(response, pil_kwargs=None):
         )
 
 
+# no longer used by the fetchers, which decode in a response hook; kept for backwards compatibility
 def response_to_array_callback(session, response):
     response.array = response_to_array(response)
 
@@ -98,24 +135,28 @@ def as_future(item):
 
 
 def fill_tiled_cuboid(min_tile_idx, max_tile_idx):
+    """
+    All tile indices in the cuboid between the given corners (inclusive).
+
+    Returns
+    -------
+    list of TileIndex
+        In (depth, row, col) order, which is the order they will be fetched in
+    """
     if not min_tile_idx.is_comparable(max_tile_idx):
         raise ValueError("Tile indices are not comparable (different zoom or size)")
 
-    iters = [
-        range(getattr(min_tile_idx, name), getattr(max_tile_idx, name) + 1)
-        for name in ("depth", "row", "col")
-    ]
-    return {
-        TileIndex(
-            depth,
-            row,
-            col,
-            min_tile_idx.zoom_level,
-            min_tile_idx.height,
-            min_tile_idx.width,
+    zoom_level = min_tile_idx.zoom_level
+    height = min_tile_idx.height
+    width = min_tile_idx.width
+    return [
+        TileIndex(depth, row, col, zoom_level, height, width)
+        for depth, row, col in itertools.product(
+            range(min_tile_idx.depth, max_tile_idx.depth + 1),
+            range(min_tile_idx.row, max_tile_idx.row + 1),
+            range(min_tile_idx.col, max_tile_idx.col + 1),
         )
-        for depth, row, col in itertools.product(*iters)
-    }
+    ]
 
 
 def dict_subtract(d1, d2):
@@ -151,12 +192,75 @@ def is_valid_format_url(format_url):
     return all("{" + component + "}" in format_url for component in components)
 
 
+def _nbytes(value):
+    # the cache is only size-constrained for arrays
+    return getattr(value, "nbytes", 0)
+
+
+class CompressedTile(object):
+    __slots__ = ("data", "shape", "dtype")
+
+    def __init__(self, array):
+        """
+        A tile array, compressed with blosc2's zstd codec to be held in a TileCache.
+
+        Parameters
+        ----------
+        array : np.ndarray
+        """
+        array = np.ascontiguousarray(array)
+        self.data = blosc2.compress(
+            array, typesize=array.itemsize, clevel=1, codec=blosc2.Codec.ZSTD
+        )
+        self.shape = array.shape
+        self.dtype = array.dtype
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def decompress(self):
+        """
+        Returns
+        -------
+        np.ndarray
+            read-only
+        """
+        return np.frombuffer(blosc2.decompress(self.data), self.dtype).reshape(
+            self.shape
+        )
+
+
 class TileCache(object):
-    def __init__(self, max_items=DEFAULT_CACHE_ITEMS, max_bytes=DEFAULT_CACHE_BYTES):
+    def __init__(
+        self,
+        max_items=DEFAULT_CACHE_ITEMS,
+        max_bytes=DEFAULT_CACHE_BYTES,
+        compress=False,
+    ):
+        """
+
+        Parameters
+        ----------
+        max_items : int, optional
+            default 10
+        max_bytes : int, optional
+            default None
+        compress : bool, optional
+            Whether to hold array values compressed (requires blosc2), so that more fit into ``max_bytes``.
+            Decompressing a cached tile is much faster than fetching it again. Default False
+        """
         super(TileCache, self).__init__()
+        if compress and blosc2 is None:
+            raise ImportError(
+                "Compressing cached tiles requires blosc2 to be installed"
+            )
         self.max_bytes = max_bytes
         self.max_items = max_items
+        self.compress = compress
         self._dict = OrderedDict()
+        # running total of the values' nbytes, kept up to date on every insertion and removal
+        self._nbytes = 0
 
     @property
     def current_bytes(self):
@@ -170,7 +274,7 @@ class TileCache(object):
         if self.max_bytes is None:
             return -1
 
-        return sum(value.nbytes for value in self._dict.values())
+        return self._nbytes
 
     def __setitem__(self, key, value):
         """
@@ -183,17 +287,23 @@ class TileCache(object):
         value : np.ndarray
         """
         if key in self._dict:
-            del self._dict[key]
+            self._nbytes -= _nbytes(self._dict.pop(key))
+        if self.compress and isinstance(value, np.ndarray):
+            value = CompressedTile(value)
         self._dict[key] = value
+        self._nbytes += _nbytes(value)
         self._constrain_size()
 
     def __getitem__(self, key):
-        value = self._dict.pop(key)
-        self._dict[key] = value
+        value = self._dict[key]
+        self._dict.move_to_end(key)
+        if isinstance(value, CompressedTile):
+            return value.decompress()
         return value
 
     def clear(self):
         self._dict.clear()
+        self._nbytes = 0
 
     def __contains__(self, item):
         return item in self._dict
@@ -204,16 +314,18 @@ class TileCache(object):
     def __iter__(self):
         return iter(self._dict)
 
+    def _pop_oldest(self):
+        _, value = self._dict.popitem(False)
+        self._nbytes -= _nbytes(value)
+
     def _constrain_size(self):
         if self.max_items is not None:
             while len(self) > self.max_items:
-                self._dict.popitem(False)
+                self._pop_oldest()
 
         if self.max_bytes is not None:
-            total_bytes = self.current_bytes
-            while total_bytes > self.max_bytes:
-                key, value = self._dict.popitem(False)
-                total_bytes -= value.nbytes
+            while self._nbytes > self.max_bytes:
+                self._pop_oldest()
 
 
 class ImageFetcher(object):
@@ -228,6 +340,7 @@ class ImageFetcher(object):
         broken_slice_handling=DEFAULT_BROKEN_SLICE_HANDLING,
         cval=0,
         auth=None,
+        compress_cache=False,
     ):
         """
 
@@ -251,6 +364,8 @@ class ImageFetcher(object):
         auth : (str, str), optional
             Tuple of (username, password) for basic HTTP authentication, to be used if the selected mirror has no
             defined ``auth``. Default None
+        compress_cache : bool, optional
+            Whether to compress cached tiles (requires blosc2), so that more fit into ``cache_bytes``. Default False
         """
         self.stack = stack
         self.depth_dimension = "z"
@@ -276,9 +391,10 @@ class ImageFetcher(object):
             ]
         )
 
-        self._tile_cache = TileCache(cache_items, cache_bytes)
+        self._tile_cache = TileCache(cache_items, cache_bytes, compress_cache)
+        self._empty_tiles = dict()
 
-        self._session = requests.Session()
+        self._session = pooled_session(THREADS, max_retries=TILE_RETRY)
         self._auth = auth
 
         self._mirror = None
@@ -398,16 +514,24 @@ class ImageFetcher(object):
 
     def _reorient_volume_src_to_tgt(self, volume):
         arr = np.asarray(volume)
-        if len(arr.shape) == 2:
-            arr = np.expand_dims(arr, 0)
-        if len(arr.shape) != 3:
+        if arr.ndim == 2:
+            arr = arr[np.newaxis]
+        if arr.ndim != 3:
             raise ValueError("Unknown dimension of volume: should be 2D or 3D")
-        return np.moveaxis(arr, (0, 1, 2), self._dimension_mappings)
+        if self._dimension_mappings == (0, 1, 2):
+            return arr
+        # target axis i is source axis mappings[i]; a strided view, so the copy happens once, into the output
+        return arr.transpose(self._dimension_mappings)
 
     def _make_empty_tile(self, width, height=None):
         height = height or width
-        tile = np.empty((height, width), dtype=np.uint8)
-        tile.fill(self.cval)
+        key = (height, width, self.cval)
+        # tiles are only ever read, so one read-only tile is shared by all missing tiles of this size
+        tile = self._empty_tiles.get(key)
+        if tile is None:
+            tile = np.full((height, width), self.cval, dtype=np.uint8)
+            tile.flags.writeable = False
+            self._empty_tiles[key] = tile
         return tile
 
     def _get_tile(self, tile_index):
@@ -453,8 +577,8 @@ class ImageFetcher(object):
 
         Returns
         -------
-        set of TileIndex
-            Set of tile indices to fetch
+        list of TileIndex
+            Tile indices to fetch
         dict of {str to dict of {str to int}}
             {'min': {}, 'max': {}} with values {'x': int, 'y': int, 'z': int}
             Pixel offsets of the minimum maximum pixels from the shallow-top-left corner of the tile which they are on
@@ -499,16 +623,16 @@ class ImageFetcher(object):
 
         tgt_tile = self._reorient_volume_src_to_tgt(src_tile[tile_slicing])
 
-        untrimmed_topleft = dict_subtract(tile_index.coords, min_tile.coords)
-        # location of the top left of the tile in out
+        # location of the top left of the tile in out, from its offset in tiles from the minimum tile
+        min_inner = src_inner_slicing["min"]
         topleft_dict = {
-            "z": untrimmed_topleft["z"],  # we don't trim in Z
+            "z": tile_index.depth - min_tile.depth,  # we don't trim in Z
             "y": 0
             if min_row
-            else untrimmed_topleft["y"] - src_inner_slicing["min"]["y"],
+            else tile_index.height * (tile_index.row - min_tile.row) - min_inner["y"],
             "x": 0
             if min_col
-            else untrimmed_topleft["x"] - src_inner_slicing["min"]["x"],
+            else tile_index.width * (tile_index.col - min_tile.col) - min_inner["x"],
         }
         topleft = tuple(topleft_dict[dim] for dim in self.target_orientation)
 
@@ -545,7 +669,9 @@ class ImageFetcher(object):
             "desc": "Downloading tiles",
         }
         for src_tile, tile_index in tqdm(self._iter_tiles(tile_indices), **tqdm_kwargs):
-            self._tile_cache[tile_index] = src_tile
+            # hits were already bumped to most-recent by _get_tile; re-inserting would recompress them
+            if tile_index not in self._tile_cache:
+                self._tile_cache[tile_index] = src_tile
             self._insert_tile_into_arr(
                 tile_index, src_tile, min_tile, max_tile, src_inner_slicing, out
             )
@@ -565,7 +691,7 @@ class ImageFetcher(object):
         """
         url = self.mirror.generate_url(tile_index)
         try:
-            return response_to_array(self._session.get(url, timeout=self.timeout))
+            return _response_to_array(self._session.get(url, timeout=self.timeout))
         except HTTPError as e:
             if e.response.status_code == 404:
                 logger.warning(
@@ -576,7 +702,8 @@ class ImageFetcher(object):
                 raise
 
     def _reorient_roi_tgt_to_src(self, roi_tgt):
-        return roi_tgt[:, self._dimension_mappings]
+        # target column i is source column mappings[i], so source column j is target column argsort(mappings)[j]
+        return roi_tgt[:, np.argsort(self._dimension_mappings)]
 
     def roi_to_scaled(self, roi, roi_mode, zoom_level):
         """
@@ -701,6 +828,38 @@ class ImageFetcher(object):
         """
         return self.get(roi, ROIMode.SCALED, zoom_level, out)
 
+    def iter_get(self, rois, roi_mode=ROIMode.STACK, zoom_level=0, prefetch=1):
+        """
+        Fetch image data for several ROIs, yielding them in order.
+
+        ROIs are fetched one at a time in a background thread, up to `prefetch` ahead of the one last yielded, so that
+        downloading the next ROI overlaps with the caller's processing of the current one. Tiles shared between
+        ROIs are served from the tile cache.
+
+        Parameters
+        ----------
+        rois : iterable of array-like
+            As for `get`
+        roi_mode : ROIMode or str
+            Default ROIMode.STACK
+        zoom_level : int
+        prefetch : int
+            Maximum number of ROIs fetched ahead of the caller (default 1)
+
+        Yields
+        ------
+        np.ndarray
+        """
+        # a single worker, so that the tile cache is only ever used by one thread at a time
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = deque()
+            for roi in rois:
+                pending.append(executor.submit(self.get, roi, roi_mode, zoom_level))
+                if len(pending) > prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
     def set_fastest_mirror(self, reps=1, normalise_by_tile_size=True):
         """
         Set the ImageFetcher to use the fastest accessible mirror.
@@ -747,7 +906,7 @@ class ImageFetcher(object):
         -------
         ImageFetcher
         """
-        stack_info = catmaid.get((catmaid.project_id, "stack", stack_id, "info"))
+        stack_info = get_stack_info(catmaid, stack_id)
         return cls.from_stack_info(stack_info, *args, **kwargs)
 
 
@@ -773,6 +932,7 @@ class ThreadedImageFetcher(ImageFetcher):
         cval=0,
         auth=None,
         threads=THREADS,
+        compress_cache=False,
     ):
         """
         Note: for small numbers of tiles on fast internet connection, ImageFetcher may be faster
@@ -796,6 +956,8 @@ class ThreadedImageFetcher(ImageFetcher):
             default 0
         threads : int
             default 10
+        compress_cache : bool
+            default False
         """
         super(ThreadedImageFetcher, self).__init__(
             stack,
@@ -807,8 +969,12 @@ class ThreadedImageFetcher(ImageFetcher):
             broken_slice_handling,
             cval,
             auth,
+            compress_cache,
+        )
+        # one pooled connection per worker, so concurrent tile requests don't discard connections
+        self._session = FuturesSession(
+            session=pooled_session(threads, self._session, TILE_RETRY), max_workers=threads
         )
-        self._session = FuturesSession(session=self._session, max_workers=threads)
 
     def _get_tile(self, tile_index):
         """
@@ -832,9 +998,9 @@ class ThreadedImageFetcher(ImageFetcher):
                 self.broken_slice_handling == BrokenSliceHandling.FILL
                 and self.cval is not None
             ):
-                tile = np.empty((tile_index.width, tile_index.height))
-                tile.fill(self.cval)
-                return as_future_response(tile)
+                return as_future_response(
+                    self._make_empty_tile(tile_index.width, tile_index.height)
+                )
             else:
                 raise NotImplementedError(
                     "'fill' with a non-None cval is the only implemented broken slice handling mode"
@@ -862,6 +1028,22 @@ class ThreadedImageFetcher(ImageFetcher):
         Future of np.ndarray in source orientation
         """
         url = self.mirror.generate_url(tile_index)
+        # decode in the worker thread, so that it overlaps with other tiles' downloads
         return self._session.get(
-            url, timeout=self.timeout, background_callback=response_to_array_callback
+            url,
+            timeout=self.timeout,
+            hooks={"response": partial(self._response_to_tile, tile_index)},
         )
+
+    def _response_to_tile(self, tile_index, response, *args, **kwargs):
+        """Response hook which sets the decoded tile as ``response.array``, or a blank tile on 404"""
+        if response.is_redirect:
+            # hooks are also dispatched on each redirect response, before it is followed
+            return
+        if response.status_code == 404:
+            logger.warning(
+                "Tile not found at %s (error 404), returning blank tile", response.url
+            )
+            response.array = self._make_empty_tile(tile_index.width, tile_index.height)
+        else:
+            response.array = _response_to_array(response)
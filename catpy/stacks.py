@@ -1,4 +1,7 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
 from enum import IntEnum
+from operator import attrgetter
 from timeit import timeit
 
 import requests
@@ -6,6 +9,9 @@ import requests
 from catpy.compat import tqdm
 from catpy.spatial import StackOrientation
 
+# replacement field in a str.format template, e.g. "{depth}"
+_FIELD_RE = re.compile(r"\{(\w+)\}")
+
 
 class StackMirror(object):
     def __init__(
@@ -45,6 +51,11 @@ class StackMirror(object):
         self.position = int(position)
 
         self.format_url = self.tile_source_type.format(**self.__dict__)
+        # %-interpolate a tuple of the TileIndex's fields, in template order: unlike str.format(**url_kwargs),
+        # this neither re-parses the template nor builds a dict for every tile
+        escaped = self.format_url.replace("%", "%%")
+        self._pct_url = _FIELD_RE.sub("%s", escaped)
+        self._url_fields = attrgetter(*_FIELD_RE.findall(escaped))
 
     def generate_url(self, tile_index):
         """
@@ -63,7 +74,7 @@ class StackMirror(object):
             and tile_index.width != self.tile_width
         ):
             raise ValueError("Given TileIndex is not compatible with this stack mirror")
-        return self.format_url.format(**tile_index.url_kwargs)
+        return self._pct_url % self._url_fields(tile_index)
 
     def get_tile_index(self, scaled_coords, zoom_level=0):
         """
@@ -136,7 +147,9 @@ class Stack(object):
         self.canary_location = canary_location or {"x": 0, "y": 0, "z": 0}
         self.mirrors = []
 
-    def get_fastest_mirror(self, timeout=1, reps=1, normalise_by_tile_size=True):
+    def get_fastest_mirror(
+        self, timeout=1, reps=1, normalise_by_tile_size=True, session=None
+    ):
         """
         Determine the fastest accessible mirror.
 
@@ -148,33 +161,63 @@ class Stack(object):
             How many times to fetch the canary tile, for robustness
         normalise_by_tile_size : bool
             Whether to normalise the fetch time by the tile size used by this mirror (to get per-pixel response time)
+        session : requests.Session, optional
+            Session to make the requests with, so that connections are kept alive across reps.
+            Default a new session, closed afterwards.
 
         Returns
         -------
         StackMirror
         """
-        response_times = []
+        if session is None:
+            # no retries, which would distort the timings
+            with requests.Session() as session:
+                return self.get_fastest_mirror(
+                    timeout, reps, normalise_by_tile_size, session
+                )
 
-        tqdm_kwargs = {"ncols": 80, "unit": "mirrors", "desc": "Checking mirrors"}
-        for mirror in tqdm(self.mirrors, **tqdm_kwargs):
-            tile_index, _ = mirror.get_tile_index(self.canary_location)
-            url = mirror.generate_url(tile_index)
+        def probe(mirror):
+            return mirror, self._time_mirror(
+                mirror, session, timeout, reps, normalise_by_tile_size
+            )
 
-            try:
-                response_time = timeit(
-                    lambda: requests.get(url, timeout=timeout), number=reps
+        tqdm_kwargs = {
+            "total": len(self.mirrors),
+            "ncols": 80,
+            "unit": "mirrors",
+            "desc": "Checking mirrors",
+        }
+        # probe all mirrors at once, so that the slow ones don't hold up the rest
+        with ThreadPoolExecutor(max_workers=max(len(self.mirrors), 1)) as executor:
+            response_times = [
+                (mirror, response_time)
+                for mirror, response_time in tqdm(
+                    executor.map(probe, self.mirrors), **tqdm_kwargs
                 )
-                if normalise_by_tile_size:
-                    response_time /= tile_index.width * tile_index.height
-                response_times.append((mirror, response_time))
-            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
-                continue
+                if response_time is not None
+            ]
 
         if not response_times:
             raise ValueError("No reachable mirrors found")
 
         return min(response_times, key=lambda pair: pair[1])[0]
 
+    def _time_mirror(self, mirror, session, timeout, reps, normalise_by_tile_size):
+        """Time to fetch the canary tile from the mirror, or None if it could not be reached"""
+        tile_index, _ = mirror.get_tile_index(self.canary_location)
+        url = mirror.generate_url(tile_index)
+
+        try:
+            response_time = timeit(
+                lambda: session.get(url, timeout=timeout), number=reps
+            )
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            return None
+
+        if normalise_by_tile_size:
+            response_time /= tile_index.width * tile_index.height
+        return response_time
+
 
 class ProjectStack(Stack):
     orientation_choices = {0: "xy", 1: "xz", 2: "zy"}
@@ -278,6 +321,9 @@ class TileIndex(object):
     url_keys = ("depth", "row", "col", "zoom_level")
     comparable_keys = ("zoom_level", "height", "width")
 
+    # one is created per tile, and they are used as dict keys: no __dict__, and the hash is computed once
+    __slots__ = hash_keys + ("_key", "_hash")
+
     def __init__(self, depth, row, col, zoom_level, height, width):
         """
 
@@ -302,6 +348,9 @@ class TileIndex(object):
         self.height = height
         self.width = width
 
+        self._key = (depth, row, col, zoom_level, height, width)
+        self._hash = hash(self._key)
+
     @property
     def coords(self):
         """
@@ -325,7 +374,12 @@ class TileIndex(object):
 
     @property
     def url_kwargs(self):
-        return {key: getattr(self, key) for key in self.url_keys}
+        return {
+            "depth": self.depth,
+            "row": self.row,
+            "col": self.col,
+            "zoom_level": self.zoom_level,
+        }
 
     def __repr__(self):
         return "TileIndex({})".format(
@@ -333,7 +387,9 @@ class TileIndex(object):
         )
 
     def __hash__(self):
-        return hash(tuple(getattr(self, name) for name in self.hash_keys))
+        return self._hash
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        if isinstance(other, TileIndex):
+            return self._hash == other._hash and self._key == other._key
+        return NotImplemented
@@ -1,4 +1,5 @@
 import webbrowser
+from urllib.parse import quote, urlencode
 from warnings import warn
 
 
@@ -27,6 +28,21 @@ def get_typed(d, key, constructor=None, default=None):
 class CatmaidUrl(object):
     tracing_tool_name = "tracingtool"
 
+    __slots__ = (
+        "base_url",
+        "project_id",
+        "default_scale",
+        "stack_group",
+        "stack_group_scale",
+        "stacks",
+        "x",
+        "y",
+        "z",
+        "tool",
+        "active_skeleton_id",
+        "active_node_id",
+    )
+
     def __init__(
         self,
         base_url,
@@ -212,46 +228,45 @@ class CatmaidUrl(object):
         return url
 
     def __str__(self):
-        elements = ["pid={}".format(self.project_id)]
+        pairs = [("pid", self.project_id)]
 
         coords = [
-            "{}p={}".format(dim, float(getattr(self, dim)))
-            for dim in "xyz"
-            if getattr(self, dim) is not None
+            (dim + "p", float(value))
+            for dim, value in (("x", self.x), ("y", self.y), ("z", self.z))
+            if value is not None
         ]
         if len(coords) == 3:
-            elements.extend(coords)
+            pairs.extend(coords)
         elif coords:
             warn("Only {} of 3 coordinates found, ignoring".format(len(coords)))
 
         if self.tool:
-            elements.append("tool=" + self.tool)
+            pairs.append(("tool", self.tool))
             if self.tool == "tracingtool":
-                elements.append("active_node_id={}".format(self.active_node_id))
-                elements.append("active_skeleton_id={}".format(self.active_skeleton_id))
+                pairs.append(("active_node_id", self.active_node_id))
+                pairs.append(("active_skeleton_id", self.active_skeleton_id))
 
         if self.stack_group is not None:
-            elements.append("sg={}".format(self.stack_group))
-            elements.append(
-                "sgs={}".format(
-                    float(self.stack_group_scale)
-                    if self.stack_group_scale is not None
-                    else float(self.default_scale)
-                )
+            scale = (
+                self.stack_group_scale
+                if self.stack_group_scale is not None
+                else self.default_scale
             )
+            pairs.append(("sg", self.stack_group))
+            pairs.append(("sgs", float(scale)))
 
         if not self.stacks:
             warn("No stacks added found, URL may be invalid")
         for idx, (stack_id, scale) in enumerate(self.stacks):
-            elements.append("sid{}={}".format(idx, stack_id))
-            elements.append(
-                "s{}={}".format(
-                    idx,
+            pairs.append(("sid{}".format(idx), stack_id))
+            pairs.append(
+                (
+                    "s{}".format(idx),
                     float(scale) if scale is not None else float(self.default_scale),
                 )
             )
 
-        return self._terminate_base_url() + "&".join(elements)
+        return self._terminate_base_url() + urlencode(pairs, quote_via=quote)
 
     def open(self):
         webbrowser.open(str(self), new=2)
@@ -22,6 +22,7 @@ requirements = [
     "Pillow>=5.0",
     "requests>=2.14",
     "requests-futures>=0.9",
+    "urllib3>=1.21.1",
 ]
 
 setup_requirements = ["pytest-runner>=2.11"]
@@ -39,6 +40,14 @@ setup(
     packages=["catpy", "catpy.applications"],
     include_package_data=True,
     install_requires=requirements,
+    extras_require={
+        "fast": ["orjson>=3"],
+        "stream": ["ijson>=3.1"],
+        "rustworkx": ["rustworkx"],
+        "jpeg": ["simplejpeg"],
+        "opencv": ["opencv-python-headless"],
+        "blosc": ["blosc2"],
+    },
     license="MIT license",
     zip_safe=False,
     keywords="catpy catmaid neuron",
@@ -1,9 +1,13 @@
 from __future__ import absolute_import
 
+import copy
 import json
+import pickle
+from io import BytesIO
 
 import pytest
 import requests
+import urllib3
 
 try:
     import mock
@@ -40,6 +44,7 @@ def error_response_dict():
         "traceback": "a long traceback",
         "error": "an error occurred",
         "type": "a bad one",
+        "detail": "some details",
     }
 
 
@@ -55,6 +60,7 @@ def response_mock():
     response = mock.Mock()
     response.headers = {"content-type": "application/json"}
     response.status_code = 200
+    response.content = b"{}"
 
     return response
 
@@ -145,6 +151,220 @@ def test_fetch_uses_session(response_mock):
     post.assert_called_with(url, data={})
 
 
+def test_session_pool_size():
+    c = CatmaidClient(BASE_URL, pool_size=5)
+    adapter = c._session.get_adapter(BASE_URL)
+    assert adapter._pool_maxsize == 5
+    assert adapter.max_retries.total == 3
+
+
+@pytest.mark.parametrize("etag_cache", [False, True])
+def test_client_pickles(etag_cache):
+    c = CatmaidClient(BASE_URL, TOKEN, project_id=1, etag_cache=etag_cache)
+    c._pool = c._make_pool()
+
+    for c2 in [pickle.loads(pickle.dumps(c)), copy.deepcopy(c)]:
+        assert c2.base_url == BASE_URL
+        assert c2.project_id == 1
+        assert c2._session.headers["X-Authorization"] == "Token " + TOKEN
+        assert c2._dispatch["GET"][0].__self__ is c2._session
+        assert c2._pool is None
+        assert (c2._etag_cache is not None) == etag_cache
+        c2.clear_etag_cache()
+
+
+def test_fetch_method_case_insensitive(response_mock):
+    url = make_url(BASE_URL, "relative")
+    with mock.patch.object(requests.Session, "get", return_value=response_mock) as get:
+        c = CatmaidClient(BASE_URL)
+        c.fetch("relative", "get")
+
+    get.assert_called_with(url, params={})
+
+
+def test_fetch_unknown_method():
+    c = CatmaidClient(BASE_URL)
+    with pytest.raises(ValueError):
+        c.fetch("relative", "PATCH")
+
+
+def test_etag_cache_revalidates(response_mock, valid_response_dict):
+    response_mock.content = json.dumps(valid_response_dict).encode()
+    response_mock.headers = {"content-type": "application/json", "ETag": '"abc"'}
+    not_modified = mock.Mock(status_code=304, headers={})
+    with mock.patch.object(
+        requests.Session, "get", side_effect=[response_mock, not_modified]
+    ) as get:
+        c = CatmaidClient(BASE_URL, etag_cache=True)
+        first = c.fetch("relative", "GET")
+        second = c.fetch("relative", "GET")
+
+    assert first == second == valid_response_dict
+    assert get.call_args[1]["headers"]["If-None-Match"] == '"abc"'
+
+
+def test_etag_cache_does_not_reparse(response_mock, valid_response_dict):
+    response_mock.content = json.dumps(valid_response_dict).encode()
+    response_mock.headers = {"content-type": "application/json", "ETag": '"abc"'}
+    not_modified = mock.Mock(status_code=304, headers={})
+    with mock.patch.object(
+        requests.Session, "get", side_effect=[response_mock, not_modified]
+    ):
+        c = CatmaidClient(BASE_URL, etag_cache=True)
+        first = c.fetch("relative", "GET")
+        with mock.patch.object(CatmaidClient, "_parse") as parse:
+            second = c.fetch("relative", "GET")
+
+    parse.assert_not_called()
+    assert second is first
+
+
+def test_etag_cache_bounded():
+    def get(url, **kwargs):
+        response = mock.Mock()
+        response.status_code = 200
+        response.headers = {"content-type": "application/json", "ETag": url}
+        response.content = json.dumps({"url": url}).encode()
+        return response
+
+    with mock.patch.object(requests.Session, "get", side_effect=get):
+        c = CatmaidClient(BASE_URL, etag_cache=True, etag_cache_size=2)
+        for relative_url in ["a", "b", "a", "c"]:
+            c.fetch(relative_url)
+
+    assert [key[0] for key in c._etag_cache] == [
+        make_url(BASE_URL, "a"),
+        make_url(BASE_URL, "c"),
+    ]
+
+
+@pytest.fixture
+def pool_response_mock(valid_response_dict):
+    response = mock.Mock()
+    response.status = 200
+    response.headers = {"content-type": "application/json"}
+    response.data = json.dumps(valid_response_dict).encode()
+    return response
+
+
+def test_fetch_fast_get(pool_response_mock, valid_response_dict):
+    with mock.patch.object(
+        urllib3.PoolManager, "urlopen", return_value=pool_response_mock
+    ) as urlopen:
+        c = CatmaidClient(BASE_URL, TOKEN)
+        ret = c.fetch_fast("relative", data={"a": [1, 2]})
+
+    assert ret == valid_response_dict
+    args, kwargs = urlopen.call_args
+    assert args == ("GET", make_url(BASE_URL, "relative") + "?a=1&a=2")
+    assert kwargs["headers"]["X-Authorization"] == "Token " + TOKEN
+
+
+def test_fetch_fast_raises(pool_response_mock):
+    pool_response_mock.status = 404
+    with mock.patch.object(
+        urllib3.PoolManager, "urlopen", return_value=pool_response_mock
+    ):
+        c = CatmaidClient(BASE_URL)
+        with pytest.raises(requests.HTTPError):
+            c.fetch_fast("relative", "POST", data={"a": 1})
+
+
+def test_fetch_pipelined_in_order():
+    def get(url, **kwargs):
+        response = mock.Mock()
+        response.status_code = 200
+        response.headers = {"content-type": "application/json"}
+        response.content = json.dumps({"url": url}).encode()
+        return response
+
+    relative_urls = ["a", "b", "c", "d", "e"]
+    with mock.patch.object(requests.Session, "get", side_effect=get):
+        c = CatmaidClient(BASE_URL)
+        results = list(c.fetch_pipelined(relative_urls))
+
+    assert results == [{"url": make_url(BASE_URL, u)} for u in relative_urls]
+
+
+def test_fetch_many_in_order():
+    def fetch(url, method="GET", data=None, raw=False):
+        return (url, method, data)
+
+    c = CatmaidClient(BASE_URL)
+    with mock.patch.object(CatmaidClient, "fetch", side_effect=fetch):
+        results = c.fetch_many([("a",), ("b", "POST", {"x": 1}), (("c", "d"), "GET")])
+
+    assert results == [
+        ("a", "GET", None),
+        ("b", "POST", {"x": 1}),
+        (("c", "d"), "GET", None),
+    ]
+
+
+@pytest.mark.parametrize(
+    "prefix,expected",
+    [
+        ("item", [{"a": [1, 2]}, {"a": [3]}]),
+        ("item.a.item", [1, 2, 3]),
+        ("", [[{"a": [1, 2]}, {"a": [3]}]]),
+    ],
+)
+def test_fetch_stream_fallback(response_mock, prefix, expected):
+    response_mock.content = b'[{"a": [1, 2]}, {"a": [3]}]'
+    with mock.patch.object(
+        requests.Session, "get", return_value=response_mock
+    ) as get, mock.patch("catpy.client.ijson", None):
+        c = CatmaidClient(BASE_URL)
+        results = c.fetch_stream("relative", prefix=prefix)
+        get.assert_not_called()
+        assert list(results) == expected
+
+    get.assert_called_with(make_url(BASE_URL, "relative"), params={}, stream=True)
+
+
+def test_fetch_stream_ijson(response_mock):
+    ijson = pytest.importorskip("ijson")
+    response_mock.raw = BytesIO(b'{"a": [{"b": 1}, {"b": 2}]}')
+    with mock.patch.object(
+        requests.Session, "get", return_value=response_mock
+    ), mock.patch("catpy.client.ijson", ijson):
+        c = CatmaidClient(BASE_URL)
+        assert list(c.fetch_stream("relative", prefix="a.item")) == [{"b": 1}, {"b": 2}]
+
+    response_mock.close.assert_called_once_with()
+
+
+@pytest.mark.parametrize("use_ijson", [False, True])
+def test_fetch_stream_floats(response_mock, use_ijson):
+    ijson = pytest.importorskip("ijson") if use_ijson else None
+    body = b"[[1.5, 2, 3.25]]"
+    response_mock.content = body
+    response_mock.raw = BytesIO(body)
+    with mock.patch.object(
+        requests.Session, "get", return_value=response_mock
+    ), mock.patch("catpy.client.ijson", ijson):
+        c = CatmaidClient(BASE_URL)
+        (coords,) = list(c.fetch_stream("relative"))
+
+    assert coords == [1.5, 2, 3.25]
+    assert [type(x) for x in coords] == [float, int, float]
+
+
+def test_download(response_mock):
+    response_mock.iter_content.return_value = [b"abc", b"de"]
+    fileobj = BytesIO()
+    with mock.patch.object(
+        requests.Session, "post", return_value=response_mock
+    ) as post:
+        c = CatmaidClient(BASE_URL)
+        written = c.download("relative", fileobj, "POST", {"a": 1})
+
+    assert written == 5
+    assert fileobj.getvalue() == b"abcde"
+    post.assert_called_with(make_url(BASE_URL, "relative"), data={"a": 1}, stream=True)
+    response_mock.close.assert_called_once_with()
+
+
 def test_raises_on_wrapped_error(response_mock):
     with mock.patch.object(
         requests.Session, "get", return_value=response_mock
@@ -155,8 +375,37 @@ def test_raises_on_wrapped_error(response_mock):
     raise_on_error.assert_called_with(response_mock)
 
 
+def test_wraps_json_error(error_response_dict):
+    response = requests.Response()
+    response.status_code = 500
+    response.url = make_url(BASE_URL, "relative")
+    response.headers["content-type"] = "application/json"
+    response._content = json.dumps(error_response_dict).encode()
+    with mock.patch.object(requests.Session, "get", return_value=response):
+        c = CatmaidClient(BASE_URL)
+        with pytest.raises(WrappedCatmaidException) as exc_info:
+            c.fetch("relative", "GET")
+
+    assert exc_info.value.error == error_response_dict["error"]
+    assert exc_info.value.detail == error_response_dict["detail"]
+
+
+def test_unparseable_json_error_not_wrapped():
+    response = requests.Response()
+    response.status_code = 500
+    response.url = make_url(BASE_URL, "relative")
+    response.headers["content-type"] = "application/json"
+    response._content = b"<html>not json</html>"
+    with mock.patch.object(requests.Session, "get", return_value=response):
+        c = CatmaidClient(BASE_URL)
+        with pytest.raises(requests.HTTPError) as exc_info:
+            c.fetch("relative", "GET")
+
+    assert not isinstance(exc_info.value, WrappedCatmaidException)
+
+
 def test_response_json(response_mock, valid_response_dict):
-    response_mock.json.return_value = valid_response_dict
+    response_mock.content = json.dumps(valid_response_dict).encode()
     with mock.patch.object(requests.Session, "get", return_value=response_mock):
         c = CatmaidClient(BASE_URL)
         ret = c.fetch("relative", "GET")
@@ -164,15 +413,23 @@ def test_response_json(response_mock, valid_response_dict):
     assert ret == valid_response_dict
 
 
-def test_response_raw_no_deserialise(response_mock):
+def test_response_json_charset(response_mock, valid_response_dict):
+    response_mock.headers["content-type"] = "application/json; charset=utf-8"
+    response_mock.content = json.dumps(valid_response_dict).encode()
+    with mock.patch.object(requests.Session, "get", return_value=response_mock):
+        c = CatmaidClient(BASE_URL)
+        ret = c.fetch("relative", "GET")
+
+    assert ret == valid_response_dict
+
+
+def test_response_raw_no_deserialise(response_mock, valid_response_dict):
+    response_mock.content = json.dumps(valid_response_dict).encode()
     response_mock.text = "text"
     with mock.patch.object(requests.Session, "get", return_value=response_mock):
         c1 = CatmaidClient(BASE_URL)
-        c1.fetch("relative", "GET", raw=False)
-        count_not_raw = response_mock.json.call_count
-        response_mock.json.reset_mock()
-        ret = c1.fetch("relative", "GET", raw=True)
-        count_raw = response_mock.json.call_count
-
-    assert count_not_raw == count_raw + 1
-    assert ret == "text"
+        ret_not_raw = c1.fetch("relative", "GET", raw=False)
+        ret_raw = c1.fetch("relative", "GET", raw=True)
+
+    assert ret_not_raw == valid_response_dict
+    assert ret_raw == "text"
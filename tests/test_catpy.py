@@ -34,3 +34,13 @@ def test_make_url_trailing_slash_unchanged():
     assert url1 == "foo/bar", "Should not add trailing slash"
     url2 = catpy.client.make_url("foo", "bar/")
     assert url2 == "foo/bar/", "Should not remove trailing slash"
+
+
+def test_make_url_components():
+    """Tests for catpy.client.make_url
+    """
+    url = catpy.client.make_url("http://foo.org/", 1, "/bar/", "", "baz")
+    assert url == "http://foo.org/1/bar/baz", "Empty components should be skipped"
+    url = catpy.client.make_url("http://foo.org/", 1, "bar", "")
+    assert url == "http://foo.org/1/bar/", "Empty last component adds trailing slash"
+    assert catpy.client.make_url("foo/") == "foo/", "No components leaves base as-is"
@@ -5,11 +5,16 @@ import json
 import os
 
 import networkx as nx
+import numpy as np
 from networkx.readwrite import json_graph
 
 import pytest
 
-from catpy.applications.export import ExportWidget, convert_nodelink_data
+from catpy.applications.export import (
+    ExportWidget,
+    SkeletonGeometry,
+    convert_nodelink_data,
+)
 
 try:
     from unittest.mock import Mock
@@ -104,3 +109,86 @@ def requirement_to_op_ver(s):
 def test_correct_nx():
     op, ver = requirement_to_op_ver(os.environ["CATPY_NX"])
     assert eval(nx.__version__ + op + ver)
+
+
+def test_rustworkx(nodelink_json, export_widget):
+    pytest.importorskip("rustworkx")
+    export_widget.get_networkx_dict = Mock(return_value=nodelink_json)
+    graph = export_widget.get_rustworkx()
+
+    assert graph.nodes() == nodelink_json["nodes"]
+    assert sorted(graph.edge_list()) == sorted(
+        (link["source"], link["target"]) for link in nodelink_json["links"]
+    )
+    assert "source" not in graph.edges()[0]
+
+
+def test_treenode_and_connector_geometry(export_widget):
+    treenodes = [
+        [1, None, 3, 1.0, 2.0, 3.0, -1, 5],
+        [2, 1, 3, 4.0, 5.0, 6.0, -1, 5],
+    ]
+    connectors = [
+        [2, 100, 1, 7.0, 8.0, 9.0],
+        [1, 50, 0, 1.5, 2.5, 3.5],
+        [1, 100, 0, 7.0, 8.0, 9.0],
+        [2, 50, 2, 1.5, 2.5, 3.5],
+        [1, 100, 1, 7.0, 8.0, 9.0],
+    ]
+    export_widget._catmaid.fetch.return_value = [treenodes, connectors]
+
+    with pytest.warns(UserWarning):
+        geometry = export_widget.get_treenode_and_connector_geometry(10)
+
+    export_widget._catmaid.fetch.assert_called_once_with(
+        (1, 10, 1, 0, "compact-skeleton"), "GET"
+    )
+    skeleton = geometry["skeletons"][10]
+    assert skeleton["treenodes"] == {
+        1: {"location": [1.0, 2.0, 3.0], "parent_id": None},
+        2: {"location": [4.0, 5.0, 6.0], "parent_id": 1},
+    }
+    assert skeleton["connectors"] == {
+        100: {
+            "presnaptic_to": [1],
+            "postsynaptic_to": [2, 1],
+            "location": [7.0, 8.0, 9.0],
+        },
+        50: {"presnaptic_to": [1], "postsynaptic_to": [], "location": [1.5, 2.5, 3.5]},
+    }
+    assert list(skeleton["connectors"]) == [100, 50]
+
+
+def test_skeleton_geometry(export_widget):
+    treenodes = [[1, None, 3, 1.0, 2.0, 3.0, -1, 5], [2, 1, 3, 4.0, 5.0, 6.0, -1, 5]]
+    connectors = [
+        [2, 100, 1, 7.0, 8.0, 9.0],
+        [1, 50, 0, 1.5, 2.5, 3.5],
+        [1, 100, 0, 7.0, 8.0, 9.0],
+    ]
+    export_widget._catmaid.fetch.return_value = [treenodes, connectors]
+
+    geometry = export_widget.get_skeleton_geometry(10, 11)
+
+    assert list(geometry) == [10, 11]
+    skeleton = geometry[10]
+    assert isinstance(skeleton, SkeletonGeometry)
+    assert skeleton.treenode_ids.tolist() == [1, 2]
+    assert skeleton.parent_ids.tolist() == [-1, 1]
+    assert skeleton.treenode_locations.shape == (2, 3)
+    assert skeleton.connector_ids.tolist() == [100, 50]
+    assert skeleton.connector_locations.tolist() == [[7.0, 8.0, 9.0], [1.5, 2.5, 3.5]]
+    assert [arr.tolist() for arr in skeleton.presynaptic] == [[1], [1]]
+    assert [arr.tolist() for arr in skeleton.postsynaptic] == [[2], []]
+
+
+def test_skeleton_geometry_float32(export_widget):
+    treenodes = [[1, None, 3, 1.0, 2.0, 3.0, -1, 5]]
+    connectors = [[1, 50, 0, 1.5, 2.5, 3.5]]
+    export_widget._catmaid.fetch.return_value = [treenodes, connectors]
+
+    skeleton = export_widget.get_skeleton_geometry(10, location_dtype=np.float32)[10]
+
+    assert skeleton.treenode_locations.dtype == np.float32
+    assert skeleton.treenode_locations.flags.c_contiguous
+    assert skeleton.connector_locations.dtype == np.float32
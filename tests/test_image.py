@@ -1,6 +1,6 @@
 from __future__ import absolute_import
 
-from itertools import cycle, chain
+from itertools import cycle, chain, permutations
 
 import pytest
 import numpy as np
@@ -8,6 +8,8 @@ import requests
 from PIL import Image
 from io import BytesIO
 from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
 from requests import HTTPError
 
 try:
@@ -20,6 +22,7 @@ from catpy.image import (
     is_valid_format_url,
     response_to_array,
     as_future,
+    as_future_response,
     fill_tiled_cuboid,
     dict_subtract,
     ImageFetcher,
@@ -127,6 +130,18 @@ def test_response_to_array_png(gradient_h, mode):
     assert np.allclose(gradient_h, returned_arr)
 
 
+@pytest.mark.parametrize("format", ["png", "jpeg"])
+def test_response_to_array_writable(gradient_h, format):
+    response_mock = make_response_mock(gradient_h, "L", format)
+    with mock.patch("catpy.image.simplejpeg", None), mock.patch(
+        "catpy.image.cv2", None
+    ):
+        returned_arr = response_to_array(response_mock)
+
+    returned_arr[0, 0] = 1
+    assert returned_arr[0, 0] == 1
+
+
 @pytest.mark.parametrize("mode", ["L", "RGB"])
 def test_response_to_array_jpeg(gradient_h, mode):
     response_mock = make_response_mock(gradient_h, mode, "jpeg")
@@ -137,6 +152,31 @@ def test_response_to_array_jpeg(gradient_h, mode):
     # assert np.allclose(gradient_h.ptp(), returned_arr.ptp())
 
 
+@pytest.mark.parametrize("mode", ["L", "RGB"])
+def test_response_to_array_jpeg_decoders_agree(gradient_h, mode):
+    pytest.importorskip("simplejpeg")
+    response_mock = make_response_mock(gradient_h, mode, "jpeg")
+    fast_arr = response_to_array(response_mock)
+    with mock.patch("catpy.image.simplejpeg", None):
+        pil_arr = response_to_array(response_mock)
+
+    assert fast_arr.dtype == pil_arr.dtype == np.uint8
+    assert fast_arr.shape == pil_arr.shape
+    assert np.abs(fast_arr.astype(int) - pil_arr).max() <= 1
+
+
+@pytest.mark.parametrize("mode", ["L", "RGB", "RGBA"])
+def test_response_to_array_png_decoders_agree(gradient_h, mode):
+    pytest.importorskip("cv2")
+    response_mock = make_response_mock(gradient_h, mode, "png")
+    fast_arr = response_to_array(response_mock)
+    with mock.patch("catpy.image.cv2", None):
+        pil_arr = response_to_array(response_mock)
+
+    assert fast_arr.dtype == pil_arr.dtype == np.uint8
+    assert np.array_equal(fast_arr, pil_arr)
+
+
 @pytest.mark.parametrize("tile_source_type,format_url", format_urls.items())
 def test_predefined_format_urls_are_valid(tile_source_type, format_url):
     assert is_valid_format_url(format_url), "URL for {} is invalid".format(
@@ -170,14 +210,14 @@ def test_fill_tiled_cuboid():
 
     results = fill_tiled_cuboid(min_tile, max_tile)
 
-    expected_results = {
+    expected_results = [
         TileIndex(1, 2, 3, **kwargs),
-        TileIndex(2, 2, 3, **kwargs),
         TileIndex(1, 3, 3, **kwargs),
-        TileIndex(2, 3, 3, **kwargs),
         TileIndex(1, 4, 3, **kwargs),
+        TileIndex(2, 2, 3, **kwargs),
+        TileIndex(2, 3, 3, **kwargs),
         TileIndex(2, 4, 3, **kwargs),
-    }
+    ]
 
     assert results == expected_results
 
@@ -190,6 +230,15 @@ def test_fill_tiled_cuboid_raises():
         fill_tiled_cuboid(min_tile, max_tile)
 
 
+def test_tile_index_equality():
+    idx = TileIndex(1, 2, 3, 0, 256, 256)
+
+    assert idx == TileIndex(1, 2, 3, 0, 256, 256)
+    assert idx != TileIndex(1, 2, 4, 0, 256, 256)
+    assert idx != (1, 2, 3, 0, 256, 256)
+    assert {idx: "tile"}[TileIndex(1, 2, 3, 0, 256, 256)] == "tile"
+
+
 def test_dict_subtract_mismatched_keys():
     d1 = {"a": 1, "b": 2}
     d2 = {"a": 5, "c": 10}
@@ -271,6 +320,15 @@ def test_stackmirror_formats_url(tile_source_type):
     assert not set("{}").issubset(response)
 
 
+@pytest.mark.parametrize("tile_source_type", format_urls.keys())
+def test_stackmirror_generate_url_matches_format(tile_source_type):
+    mirror = StackMirror(IMAGE_BASE + "100%25/", 256, 256, tile_source_type, "png")
+    tile_idx = TileIndex(1, 2, 3, 4, 256, 256)
+
+    expected = mirror.format_url.format(**tile_idx.url_kwargs)
+    assert mirror.generate_url(tile_idx) == expected
+
+
 def test_stackmirror_raises_on_incompatible_tile_index():
     mirror = StackMirror(IMAGE_BASE, 512, 512, TILE_SOURCE_TYPE, "png")
     tile_idx = TileIndex(0, 0, 0, 0, 256, 256)
@@ -325,12 +383,23 @@ def test_stack_fastest_mirror_calls_get():
     stack = Stack(None)
     stack.mirrors = [StackMirror(IMAGE_BASE, 512, 512, TILE_SOURCE_TYPE, "png")] * 3
 
-    with mock.patch("requests.get") as mock_get:
+    with mock.patch("requests.Session.get") as mock_get:
         stack.get_fastest_mirror()
 
     assert mock_get.call_count == 3
 
 
+def test_stack_fastest_mirror_uses_session():
+    stack = Stack(None)
+    stack.mirrors = [StackMirror(IMAGE_BASE, 512, 512, TILE_SOURCE_TYPE, "png")] * 3
+    session = mock.Mock()
+
+    stack.get_fastest_mirror(reps=2, session=session)
+
+    assert session.get.call_count == 6
+    session.close.assert_not_called()
+
+
 def test_stack_fastest_mirror_raises():
     stack = Stack(None)
     stack.mirrors = [StackMirror(IMAGE_BASE, 512, 512, TILE_SOURCE_TYPE, "png")] * 3
@@ -448,6 +517,44 @@ def test_tilecache_can_constrain_bytes():
     assert set(cache) == {1, 2, 3}
 
 
+def test_tilecache_tracks_bytes():
+    small, large = np.ones((10, 10)), np.ones((20, 20))
+    cache = TileCache(2, large.nbytes * 10)
+
+    cache[0] = small
+    cache[0] = large
+    assert cache.current_bytes == large.nbytes
+
+    cache[1] = small
+    cache[2] = small
+    assert set(cache) == {1, 2}
+    assert cache.current_bytes == 2 * small.nbytes
+
+    cache.clear()
+    assert cache.current_bytes == 0
+
+
+def test_tilecache_compressed():
+    pytest.importorskip("blosc2")
+    arr = np.zeros((100, 100), dtype=np.uint8)
+    cache = TileCache(None, arr.nbytes, compress=True)
+
+    for key in range(3):
+        cache[key] = arr
+    assert set(cache) == {0, 1, 2}
+    assert cache.current_bytes < arr.nbytes
+
+    returned = cache[0]
+    assert returned.dtype == arr.dtype
+    assert np.array_equal(returned, arr)
+
+
+def test_tilecache_compressed_requires_blosc2():
+    with mock.patch("catpy.image.blosc2", None):
+        with pytest.raises(ImportError):
+            TileCache(compress=True)
+
+
 ######################
 # ImageFetcher tests #
 ######################
@@ -567,6 +674,16 @@ def test_imagefetcher_get_auth_fallback(min_fetcher):
     assert min_fetcher._session.auth == ("name", "pass")
 
 
+@pytest.mark.parametrize("fetcher_class", [ImageFetcher, ThreadedImageFetcher])
+def test_imagefetcher_retries_status_only(fetcher_class):
+    fetcher = fetcher_class(Stack(None))
+    session = getattr(fetcher._session, "session", fetcher._session)
+    retry = session.get_adapter(IMAGE_BASE).max_retries
+
+    assert retry.connect == retry.read == retry.other == 0
+    assert 503 in retry.status_forcelist
+
+
 def test_imagefetcher_clear_cache(min_fetcher):
     min_fetcher._tile_cache.clear = mock.Mock()
     min_fetcher.clear_cache()
@@ -588,6 +705,51 @@ def test_imagefetcher_reorient(min_fetcher):
     assert min_fetcher._reorient_volume_src_to_tgt(arr).shape == (5, 4, 3)
 
 
+@pytest.mark.parametrize("target", ["".join(p) for p in permutations("zyx")])
+def test_imagefetcher_get_orientations(target):
+    # each voxel's value encodes its source (z, y, x) location
+    shape_zyx = (3, 4, 5)
+    volume_zyx = np.arange(np.prod(shape_zyx), dtype=np.uint8).reshape(shape_zyx)
+
+    stack = Stack(None)
+    stack.mirrors.append(
+        StackMirror(IMAGE_BASE, shape_zyx[1], shape_zyx[2], TILE_SOURCE_TYPE, "png")
+    )
+    fetcher = ImageFetcher(stack, output_orientation=target, preferred_mirror=0)
+    fetcher._fetch = mock.Mock(side_effect=lambda idx: volume_zyx[idx.depth])
+
+    shape_tgt = tuple(shape_zyx["zyx".index(dim)] for dim in target)
+    out = fetcher.get([[0, 0, 0], shape_tgt], ROIMode.SCALED, 0)
+
+    expected = volume_zyx.transpose(["zyx".index(dim) for dim in target])
+    assert np.array_equal(out, expected)
+
+
+@pytest.mark.parametrize("fetcher_class", [ImageFetcher, ThreadedImageFetcher])
+def test_imagefetcher_cache_hits_not_reinserted(fetcher_class):
+    stack = Stack(None)
+    stack.mirrors.append(StackMirror(IMAGE_BASE, 4, 5, TILE_SOURCE_TYPE, "png"))
+    fetcher = fetcher_class(stack, preferred_mirror=0)
+    tile = np.ones((4, 5), dtype=np.uint8)
+    fetcher._fetch = mock.Mock(
+        side_effect=lambda idx: (
+            tile if fetcher_class is ImageFetcher else as_future_response(tile)
+        )
+    )
+    roi = [[0, 0, 0], [2, 4, 5]]
+
+    with mock.patch.object(
+        TileCache, "__setitem__", autospec=True, side_effect=TileCache.__setitem__
+    ) as setitem:
+        first = fetcher.get(roi, ROIMode.SCALED, 0)
+        assert setitem.call_count == 2
+        second = fetcher.get(roi, ROIMode.SCALED, 0)
+
+    assert setitem.call_count == 2
+    assert fetcher._fetch.call_count == 2
+    assert np.array_equal(first, second)
+
+
 def test_imagefetcher_reorient_expands(min_fetcher):
     min_fetcher.source_orientation = "zyx"
     min_fetcher.target_orientation = "xyz"
@@ -634,7 +796,7 @@ def test_imagefetcher_roi_to_tiles(min_fetcher, roi, expected_drc, expected_yx_m
 
     tiles, slicing = min_fetcher._roi_to_tiles(roi, zoom_level)
 
-    assert tiles == expected_tiles
+    assert set(tiles) == expected_tiles
     assert slicing == expected_bounds
 
 
@@ -775,6 +937,16 @@ def test_imagefetcher_get_tile_from_broken_slice(realistic_fetcher, tile_gen):
     realistic_fetcher._fetch.assert_not_called()
 
 
+def test_imagefetcher_empty_tile_shared(min_fetcher):
+    tile = min_fetcher._make_empty_tile(100, 50)
+    assert tile.shape == (50, 100)
+    assert not tile.flags.writeable
+    assert min_fetcher._make_empty_tile(100, 50) is tile
+
+    min_fetcher.cval = 255
+    assert (min_fetcher._make_empty_tile(100, 50) == 255).all()
+
+
 def test_imagefetcher_get_tile_from_fetch(min_fetcher):
     idx = TileIndex(0, 0, 0, 0, 100, 100)
     min_fetcher._fetch = mock.Mock()
@@ -785,7 +957,7 @@ def test_imagefetcher_get_tile_from_fetch(min_fetcher):
 def test_imagefetcher_fetch(min_fetcher):
     idx = TileIndex(0, 0, 0, 0, 100, 100)
     min_fetcher._session.get = mock.Mock()
-    with mock.patch("catpy.image.response_to_array", mock.Mock()):
+    with mock.patch("catpy.image._response_to_array", mock.Mock()):
         min_fetcher._fetch(idx)
     min_fetcher._session.get.assert_called_once()
 
@@ -797,17 +969,93 @@ def test_imagefetcher_get_wrappers(min_fetcher, space):
     min_fetcher.get.assert_called_with("roi", space, "zoom_level", None)
 
 
+def test_imagefetcher_iter_get(min_fetcher):
+    min_fetcher.get = mock.Mock(side_effect=lambda roi, *args: roi * 2)
+
+    results = min_fetcher.iter_get(range(5), ROIMode.SCALED, 1, prefetch=1)
+    assert next(results) == 0
+    assert min_fetcher.get.call_count <= 2
+
+    assert list(results) == [2, 4, 6, 8]
+    min_fetcher.get.assert_called_with(4, ROIMode.SCALED, 1)
+
+
 def test_404_handled_correctly(min_fetcher):
     idx = TileIndex(0, 0, 0, 0, 100, 100)
     min_fetcher._session.get = mock.Mock(
         side_effect=HTTPError(response=mock.Mock(status_code=404))
     )
-    with mock.patch("catpy.image.response_to_array", mock.Mock()):
+    with mock.patch("catpy.image._response_to_array", mock.Mock()):
         tile = min_fetcher._fetch(idx)
     assert tile.shape == (100, 100)
     assert (tile == 0).sum() == tile.size
 
 
-@pytest.mark.xfail(reason="404 handling not implemented for threaded fetcher")
-def test_404_handled_correctly_threaded(min_fetcher):
-    assert False
+@pytest.fixture
+def redirecting_tile_server():
+    """Local server which redirects every tile request to a 16x16 PNG"""
+    buffer = BytesIO()
+    Image.fromarray(np.full((16, 16), 7, dtype=np.uint8)).save(buffer, "png")
+    png = buffer.getvalue()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/redirected/"):
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(png)))
+                self.end_headers()
+                self.wfile.write(png)
+            else:
+                self.send_response(302)
+                self.send_header("Location", "/redirected" + self.path)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("fetcher_class", [ImageFetcher, ThreadedImageFetcher])
+def test_fetch_follows_redirects(redirecting_tile_server, fetcher_class):
+    stack = ProjectStack(
+        dimension={"z": 1, "y": 16, "x": 16},
+        translation={"z": 0, "y": 0, "x": 0},
+        resolution={"z": 1, "y": 1, "x": 1},
+        orientation="xy",
+    )
+    stack.mirrors.append(
+        StackMirror(redirecting_tile_server, 16, 16, TILE_SOURCE_TYPE, "png")
+    )
+    fetcher = fetcher_class(stack, preferred_mirror=0)
+
+    out = fetcher.get([[0, 0, 0], [1, 16, 16]], ROIMode.SCALED, 0)
+    assert out.shape == (1, 16, 16)
+    assert (out == 7).all()
+
+
+def test_404_handled_correctly_threaded():
+    stack = ProjectStack(
+        dimension={"z": 10, "y": 100, "x": 100},
+        translation={"z": 0, "y": 0, "x": 0},
+        resolution={"z": 1, "y": 1, "x": 1},
+        orientation="xy",
+    )
+    stack.mirrors.append(
+        StackMirror(IMAGE_BASE, 100, 100, TILE_SOURCE_TYPE, "png", "title", 0)
+    )
+    fetcher = ThreadedImageFetcher(stack, preferred_mirror=0)
+    idx = TileIndex(0, 0, 0, 0, 100, 50)
+    response = mock.Mock(
+        status_code=404, is_redirect=False, url="http://example.com/0/0_0_0.png"
+    )
+    fetcher._response_to_tile(idx, response)
+    assert response.array.shape == (100, 50)
+    assert (response.array == 0).sum() == response.array.size
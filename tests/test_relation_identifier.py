@@ -3,10 +3,20 @@ from __future__ import absolute_import
 import pytest
 
 from catpy.client import CatmaidClient
-from catpy.enums import ConnectorRelation
+from catpy.enums import ConnectorRelation, ConnectorRelationType
 from catpy.applications import RelationIdentifier
 
 
+@pytest.mark.parametrize("relation", list(ConnectorRelation))
+def test_relation_type(relation):
+    assert relation.type is ConnectorRelationType.from_relation(relation)
+    assert relation.is_synaptic == (relation.type is ConnectorRelationType.SYNAPTIC)
+    assert relation.is_synaptic == (
+        relation
+        in (ConnectorRelation.presynaptic_to, ConnectorRelation.postsynaptic_to)
+    )
+
+
 def test_from_id(relation_identifier):  # noqa
     assert relation_identifier.from_id(0) == ConnectorRelation.presynaptic_to
 
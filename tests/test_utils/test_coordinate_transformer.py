@@ -12,6 +12,7 @@ except ImportError:
     import mock
 
 from catpy import CoordinateTransformer
+from catpy.client import AbstractCatmaidClient, get_stack_info
 from catpy.spatial import StackOrientation
 
 COUNT = 20
@@ -90,6 +91,30 @@ def test_from_catmaid(default_coord_transformer, catmaid_mock):
     )
 
 
+def test_from_catmaid_cached(default_coord_transformer, catmaid_mock):
+    for _ in range(2):
+        CoordinateTransformer.from_catmaid(catmaid_mock, 1)
+    assert catmaid_mock.get.call_count == 1
+
+    CoordinateTransformer.from_catmaid(catmaid_mock, 2)
+    assert catmaid_mock.get.call_count == 2
+
+    AbstractCatmaidClient.invalidate_stack_cache(catmaid_mock)
+    CoordinateTransformer.from_catmaid(catmaid_mock, 1)
+    assert catmaid_mock.get.call_count == 3
+
+
+def test_stack_info_cache_not_shared(catmaid_mock):
+    info = get_stack_info(catmaid_mock, 1)
+    info["resolution"]["x"] = -1
+    info["orientation"] = "mutated"
+
+    info2 = get_stack_info(catmaid_mock, 1)
+    assert catmaid_mock.get.call_count == 1
+    assert info2["resolution"] == {"x": 1.0, "y": 2.0, "z": 3.0}
+    assert info2["orientation"] == default_orientation
+
+
 @pytest.mark.parametrize("dim", DIMS)
 def test_project_to_stack_coord(
     dim, default_coord_transformer, default_res, default_trans
@@ -171,6 +196,64 @@ def test_arrays(coordinate_generator, default_coord_transformer, direction, dims
     assert np.allclose(actual_response, expected_response)
 
 
+@pytest.mark.parametrize("orientation", ["XZ", "ZY"])
+@pytest.mark.parametrize("direction", DIRECTIONS)
+def test_arrays_orientation(
+    coordinate_generator, default_res, default_trans, direction, orientation
+):
+    coord_trans = CoordinateTransformer(default_res, default_trans, orientation)
+    coords_list = list(coordinate_generator())
+    coords_array = np.array([[coords[dim] for dim in "zyx"] for coords in coords_list])
+
+    expected_response = get_expected_array_response(
+        coord_trans, direction, coords_list, "zyx"
+    )
+    actual_response = getattr(coord_trans, direction + "_array")(
+        coords_array, dims="zyx"
+    )
+
+    assert np.allclose(actual_response, expected_response)
+
+
+@pytest.mark.parametrize("direction", DIRECTIONS)
+def test_arrays_dtype(coordinate_generator, default_coord_transformer, direction):
+    coords_array = np.array(
+        [[coords[dim] for dim in "xyz"] for coords in coordinate_generator()]
+    )
+    method = getattr(default_coord_transformer, direction + "_array")
+
+    expected_response = method(coords_array)
+    actual_response = method(coords_array, dtype=np.float32)
+
+    assert actual_response.dtype == np.float32
+    assert np.allclose(actual_response, expected_response, rtol=1e-6)
+
+
+@pytest.mark.parametrize("orientation", ["XY", "XZ", "ZY"])
+@pytest.mark.parametrize("scale_z", [False, True])
+def test_project_to_scaled_array(
+    coordinate_generator, default_res, default_trans, orientation, scale_z
+):
+    coord_trans = CoordinateTransformer(
+        default_res, default_trans, orientation, scale_z
+    )
+    coords_array = np.array(
+        [[coords[dim] for dim in "zyx"] for coords in coordinate_generator()]
+    )
+
+    for src_zoom, tgt_zoom in product(ZOOM_LEVELS, repeat=2):
+        expected_response = coord_trans.stack_to_scaled_array(
+            coord_trans.project_to_stack_array(coords_array, dims="zyx"),
+            tgt_zoom,
+            src_zoom,
+            dims="zyx",
+        )
+        actual_response = coord_trans.project_to_scaled_array(
+            coords_array, tgt_zoom, src_zoom, dims="zyx"
+        )
+        assert np.allclose(actual_response, expected_response)
+
+
 @pytest.mark.parametrize("dim", "xyz")
 def test_stack_to_scaled_coord(default_coord_transformer, dim):
     coord = EXAMPLE_COORD